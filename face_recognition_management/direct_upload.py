@@ -0,0 +1,75 @@
+import os
+import time
+from django.core import signing
+from .services import S3Service
+from .ultils.image import inspect_image_header
+from .ultils.uploads import UPLOAD_MAX_IMAGE_BYTES
+
+s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
+
+
+class DirectUploadService:
+    """
+    Two-phase uploads: the client gets a presigned POST for one key of its
+    device and sends the image straight to S3, then finalizes with the signed
+    upload token it received. The image bytes never go through a worker:
+    only the header is read back to check the format, the photo is not
+    re-encoded, and its key is per upload rather than a content hash.
+    """
+    EXPIRES_IN = int(os.environ.get('DIRECT_UPLOAD_EXPIRES_IN', 600))  # in seconds
+    # Rekognition reads S3 objects of up to 15 MB
+    MAX_BYTES = min(UPLOAD_MAX_IMAGE_BYTES, 15 * 1024 * 1024)
+    # Enough to reach the size marker of a JPEG behind a full EXIF segment
+    HEADER_BYTES = 128 * 1024
+
+    @staticmethod
+    def image_key(device_id, username):
+        return f"{device_id}/{int(time.time() * 1000)}-{username}.jpg"
+
+    @staticmethod
+    def issue(purpose, image_key, **claims):
+        """
+        Returns:
+            dict: `url` and `fields` of the presigned POST, the `uploadToken`
+            to finalize with and the `key` of the object.
+        """
+        presigned_post = S3Service.presigned_post(
+            s3_bucket_employees, image_key, DirectUploadService.MAX_BYTES, DirectUploadService.EXPIRES_IN
+        )
+        upload_token = signing.dumps({"key": image_key, **claims}, salt=f"direct-upload:{purpose}")
+        return {
+            "url": presigned_post["url"],
+            "fields": presigned_post["fields"],
+            "uploadToken": upload_token,
+            "key": image_key,
+            "expiresIn": DirectUploadService.EXPIRES_IN
+        }
+
+    @staticmethod
+    def verify(purpose, upload_token):
+        """
+        Returns:
+            dict | None: The claims of a valid token whose object was uploaded.
+        """
+        try:
+            claims = signing.loads(
+                upload_token, salt=f"direct-upload:{purpose}",
+                # The client may finish the upload right before the POST expires
+                max_age=DirectUploadService.EXPIRES_IN * 2
+            )
+        except signing.BadSignature:
+            return None
+
+        size = S3Service.get_object_size(s3_bucket_employees, claims["key"])
+        if not size or size > DirectUploadService.MAX_BYTES:
+            return None
+        return claims
+
+    @staticmethod
+    def validate_image(image_key):
+        """
+        Raises:
+            InvalidImageError: The uploaded object is not a JPEG or PNG image.
+        """
+        header_data = S3Service.get_object_head(s3_bucket_employees, image_key, DirectUploadService.HEADER_BYTES)
+        inspect_image_header(header_data or b'')
@@ -0,0 +1,203 @@
+import csv
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from .repository import UserRepository
+from .repositories.user_repository import DuplicateUserError
+from .services import RekognitionService, AwsIoTService
+from .local_recognition import LocalRecognitionService
+from .image_variants import ImageVariantService
+from .image_store import ImageStore
+from .constants import Role, Prefix, UserAccountStatus
+from .ultils.index import password_encrypt
+from .ultils.image import normalize_image, InvalidImageError
+from .ultils.uploads import UPLOAD_MAX_IMAGE_BYTES
+
+
+class EmployeeImportService:
+    """
+    Register the employees of a site from a CSV manifest and a ZIP of photos.
+
+    Manifest columns: username, password, firstName, lastName, position,
+    gender, rfidId, department, employeeId, image (file name inside the ZIP).
+    """
+    WORKERS = int(os.environ.get('EMPLOYEE_IMPORT_WORKERS', 4))
+    # Uncompressed size of the whole photos archive, a small ZIP can inflate to gigabytes
+    MAX_UNCOMPRESSED_BYTES = int(os.environ.get('EMPLOYEE_IMPORT_MAX_UNCOMPRESSED_BYTES', 1024 * 1024 * 1024))
+    REQUIRED_COLUMNS = ['username', 'image']
+    DUPLICATE_MESSAGES = {
+        'id': "Face already exists!",
+        'username': "Username is already exist",
+        'rfid': "RFID ID is already exist",
+    }
+
+    @staticmethod
+    def read_manifest(manifest_file):
+        manifest = manifest_file.read().decode('utf-8-sig')
+        return list(csv.DictReader(io.StringIO(manifest)))
+
+    @staticmethod
+    def import_employees(registor_id, manifest_file, photos_file):
+        """
+        Returns:
+            dict: `isSuccess`, `message` and the per-row `report`.
+
+        Raises:
+            PasswordHasherBusyError: The passwords could not be hashed, nothing was registered.
+        """
+        response_message = {
+            "isSuccess": False,
+            "message": "",
+            "report": []
+        }
+
+        found_registor = UserRepository.find_active_user_by_id(registor_id)
+        if not found_registor:
+            response_message["message"] = "Registor not found!"
+            return response_message
+        device_id = found_registor["device_id"]
+
+        try:
+            rows = EmployeeImportService.read_manifest(manifest_file)
+            photos = zipfile.ZipFile(photos_file)
+        except (UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+            response_message["message"] = f"Invalid manifest or photos archive: {e}"
+            return response_message
+
+        # Sizes from the central directory, checked before anything is inflated
+        photo_sizes = {info.filename: info.file_size for info in photos.infolist()}
+        if sum(photo_sizes.values()) > EmployeeImportService.MAX_UNCOMPRESSED_BYTES:
+            response_message["message"] = "Photos archive is too large once uncompressed"
+            return response_message
+
+        # One scan for the whole manifest instead of two per employee
+        usernames, rfid_ids = UserRepository.find_identity_keys()
+
+        report = []
+        accepted_rows = []
+        for row_number, row in enumerate(rows, start=1):
+            row_report = {"row": row_number, "username": row.get("username"), "isSuccess": False, "message": "", "id": None}
+            report.append(row_report)
+
+            missing_columns = [column for column in EmployeeImportService.REQUIRED_COLUMNS if not row.get(column)]
+            if missing_columns:
+                row_report["message"] = f"Missing {', '.join(missing_columns)}"
+                continue
+
+            if row["username"] in usernames:
+                row_report["message"] = "Username is already exist"
+                continue
+
+            rfid_id = row.get("rfidId")
+            if rfid_id and rfid_id in rfid_ids:
+                row_report["message"] = "RFID ID is already exist"
+                continue
+
+            if row["image"] not in photo_sizes:
+                row_report["message"] = f"Image {row['image']} not found in archive"
+                continue
+
+            if photo_sizes[row["image"]] > UPLOAD_MAX_IMAGE_BYTES:
+                row_report["message"] = f"Image {row['image']} is too large"
+                continue
+
+            # Claim the keys so duplicates inside the manifest are caught too
+            usernames.add(row["username"])
+            if rfid_id:
+                rfid_ids.add(rfid_id)
+            accepted_rows.append((row, row_report))
+
+        # Hashed before any face is indexed, PasswordHasherBusyError fails the
+        # whole import (503) without leaving faces or photos behind
+        with ThreadPoolExecutor(max_workers=EmployeeImportService.WORKERS) as executor:
+            password_hashes = list(executor.map(
+                lambda accepted_row: password_encrypt(accepted_row[0].get("password") or "1"), accepted_rows
+            ))
+        for (row, _), password_hash in zip(accepted_rows, password_hashes):
+            row["password_hash"] = password_hash
+
+        collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
+
+        def register(accepted_row):
+            row, row_report = accepted_row
+            username = row["username"]
+            try:
+                # ZipExtFile stops at the declared size, a lying header fails its CRC check
+                with photos.open(row["image"]) as photo:
+                    image_data, _ = normalize_image(photo.read(UPLOAD_MAX_IMAGE_BYTES + 1))
+            except (InvalidImageError, zipfile.BadZipFile) as e:
+                row_report["message"] = str(e)
+                return None
+
+            image_filename, needs_upload = ImageStore.reserve(device_id, image_data)
+            index_face_response = RekognitionService.register_face(
+                image_data, image_filename, username.replace("@gmail.com", ""), collection_id, upload=needs_upload
+            )
+            if not index_face_response["isSuccess"]:
+                ImageStore.release(image_filename)
+                row_report["message"] = index_face_response["message"]
+                return None
+
+            user = {
+                'id': index_face_response["face_id"],
+                'device_id': device_id,
+                'username': username,
+                'password': row["password_hash"],
+                'image': image_filename,
+                'face_image': image_filename,
+                'creation_time': datetime.now().isoformat(),
+                'role': Role.EMPLOYEE.value,
+                'status': UserAccountStatus.ACTIVE.value,
+                'first_name': row.get("firstName"),
+                'last_name': row.get("lastName"),
+                'position': row.get("position"),
+                'rfid_id': row.get("rfidId"),
+                'gender': row.get("gender"),
+                'deparment': row.get("department"),
+                'employee_id': row.get("employeeId")
+            }
+            # Transactional put with its guards, the scan above may be stale
+            # when another registration claims the username or RFID meanwhile
+            try:
+                UserRepository.create_user(user)
+            except DuplicateUserError as e:
+                RekognitionService.delete_face(collection_id, user["id"])
+                ImageStore.release(image_filename)
+                row_report["message"] = EmployeeImportService.DUPLICATE_MESSAGES.get(e.field, "Employee already exists")
+                return None
+
+            row_report["isSuccess"] = True
+            row_report["message"] = "Success!"
+            row_report["id"] = user["id"]
+            return user
+
+        with ThreadPoolExecutor(max_workers=EmployeeImportService.WORKERS) as executor:
+            users = [user for user in executor.map(register, accepted_rows) if user]
+
+        if users:
+            LocalRecognitionService.invalidate(device_id)
+            # Variants are read back from S3, the photos are not kept in memory
+            for user in users:
+                ImageVariantService.schedule(user["id"], user["image"])
+
+            # One roster sync for the device instead of one message per employee
+            message = {
+                "type": "SYNC/USERS",
+                "message": "Sync data",
+                "users": [
+                    {
+                        "rfid": user["rfid_id"],
+                        "id": user["id"],
+                        "name": f"{user['first_name']} {user['last_name']}",
+                    }
+                    for user in users
+                ]
+            }
+            AwsIoTService.publish_message(topic="pbl/device/employee/add", message=message)
+
+        response_message["isSuccess"] = True
+        response_message["message"] = f"Imported {len(users)}/{len(rows)} employees"
+        response_message["report"] = report
+        return response_message
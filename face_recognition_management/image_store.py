@@ -0,0 +1,105 @@
+import hashlib
+import os
+import time
+from .repository import UserRepository
+from .repositories.user_repository import ImageDeletingError
+from .services import S3Service
+
+s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
+# A deletion tombstone older than this was left by a collector that died
+IMAGE_TOMBSTONE_TTL = int(os.environ.get('IMAGE_TOMBSTONE_TTL', 300))  # in seconds
+# How long a new reference waits for the collector to finish deleting the image
+IMAGE_DELETE_WAIT = float(os.environ.get('IMAGE_DELETE_WAIT', 10))  # in seconds
+
+
+class ImageStore:
+    """
+    Content-addressed employee images: `{device_id}/sha256/<digest>.jpg`.
+
+    Every user pointing at an image holds one reference on it. Storing bytes
+    that already exist only takes a reference, the PUT is skipped. Images
+    whose count drops to zero are deleted in bulk by `manage.py gc_images`.
+
+    The collector tombstones an image before deleting its object. A new
+    reference waits until the tombstone is gone, then finds no reference
+    item and uploads the bytes again.
+    """
+    HASH_CHUNK_SIZE = 64 * 1024
+
+    @staticmethod
+    def content_key(device_id, image_data):
+        digest = hashlib.sha256()
+        if isinstance(image_data, (bytes, bytearray)):
+            digest.update(image_data)
+        else:
+            # Uploaded (possibly spooled) file, hashed without reading it whole
+            image_data.seek(0)
+            for chunk in iter(lambda: image_data.read(ImageStore.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            image_data.seek(0)
+        return f"{device_id}/sha256/{digest.hexdigest()}.jpg"
+
+    @staticmethod
+    def acquire(image_key):
+        """
+        Returns:
+            int | None: The count before, None when the image has to be uploaded again.
+        """
+        deadline = time.monotonic() + IMAGE_DELETE_WAIT
+        while True:
+            try:
+                return UserRepository.add_image_reference(image_key, 1)
+            except ImageDeletingError as e:
+                if e.deleting_at < time.time() - IMAGE_TOMBSTONE_TTL:
+                    UserRepository.clear_image_tombstone(image_key, e.deleting_at)
+                    continue
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    @staticmethod
+    def release(image_key):
+        if image_key:
+            UserRepository.add_image_reference(image_key, -1)
+
+    @staticmethod
+    def reserve(device_id, image_data):
+        """
+        Take a reference on the image before it is written.
+
+        Returns:
+            tuple: (key, whether the caller still has to upload the bytes).
+        """
+        image_key = ImageStore.content_key(device_id, image_data)
+        previous_count = ImageStore.acquire(image_key)
+        # Without a reference item the collector may be deleting the object
+        # right now, an earlier failed upload may have left a count without one
+        needs_upload = previous_count is None or not S3Service.object_exists(s3_bucket_employees, image_key)
+        return image_key, needs_upload
+
+    @staticmethod
+    def store(device_id, image_data):
+        """
+        Returns:
+            str | None: The key of the referenced image, None if the upload failed.
+        """
+        image_key, needs_upload = ImageStore.reserve(device_id, image_data)
+        if needs_upload and not S3Service.put_object(s3_bucket_employees, image_key, image_data):
+            ImageStore.release(image_key)
+            return None
+        return image_key
+
+    @staticmethod
+    def replace_avatar(user, image_key):
+        """
+        Drop the references `user` no longer needs once the already acquired
+        `image_key` becomes its avatar. The registration photo in `face_image`
+        keeps its own reference.
+        """
+        previous_key = user.get("image")
+        face_image = user.get("face_image")
+        if previous_key not in (face_image, image_key):
+            ImageStore.release(previous_key)
+        if image_key in (face_image, previous_key):
+            # The user already held this image
+            ImageStore.release(image_key)
@@ -0,0 +1,79 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .repository import UserRepository
+from .services import S3Service
+from .ultils.image import make_thumbnail, InvalidImageError
+
+s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
+
+
+class ImageVariantService:
+    """
+    Derive display sizes of employee images so list views don't download the
+    original.
+
+    Variants are written next to the original (`<name>_small.jpg`) and
+    recorded on the user as `image_variants`: the name of each variant and the
+    `source` image they were made from. A variant is only used while the user
+    still has that image.
+    """
+    # Longest edge in pixels, smallest first
+    VARIANTS = [
+        ('small', int(os.environ.get('IMAGE_VARIANT_SMALL', 96))),
+        ('medium', int(os.environ.get('IMAGE_VARIANT_MEDIUM', 320))),
+    ]
+    executor = ThreadPoolExecutor(max_workers=int(os.environ.get('IMAGE_VARIANT_WORKERS', 2)), thread_name_prefix="image-variants")
+
+    @staticmethod
+    def variant_key(image_key, name):
+        root, _ = os.path.splitext(image_key)
+        return f"{root}_{name}.jpg"
+
+    @staticmethod
+    def generate(user_id, image_key, image_data=None):
+        """
+        Returns:
+            bool: Whether the variants were stored and recorded.
+        """
+        if image_data is None:
+            image_data = S3Service.get_object(s3_bucket_employees, image_key)
+            if image_data is None:
+                return False
+
+        image_variants = {"source": image_key}
+        try:
+            for name, max_dimension in ImageVariantService.VARIANTS:
+                variant_key = ImageVariantService.variant_key(image_key, name)
+                if not S3Service.put_object(s3_bucket_employees, variant_key, make_thumbnail(image_data, max_dimension)):
+                    return False
+                image_variants[name] = variant_key
+        except InvalidImageError as e:
+            print(f"Can't make variants of {image_key}: {e}")
+            return False
+
+        return UserRepository.update_image_variants(user_id, image_key, image_variants)
+
+    @staticmethod
+    def schedule(user_id, image_key, image_data=None):
+        def generate():
+            try:
+                ImageVariantService.generate(user_id, image_key, image_data)
+            except Exception as e:
+                print(f"Failed to make variants of {image_key}: {e}")
+
+        ImageVariantService.executor.submit(generate)
+
+    @staticmethod
+    def pick(image_key, image_variants=None, size=None):
+        """
+        Smallest variant whose longest edge is at least `size` pixels (the
+        smallest one when no size is asked), the original when none fits or
+        the variants are missing or outdated.
+        """
+        if not image_variants or image_variants.get("source") != image_key:
+            return image_key
+
+        for name, max_dimension in ImageVariantService.VARIANTS:
+            if (size is None or max_dimension >= size) and image_variants.get(name):
+                return image_variants[name]
+        return image_key
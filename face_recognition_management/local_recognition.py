@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from .repository import UserRepository
+from .services import S3Service, RekognitionService
+from .constants import Role, UserAccountStatus
+from .ultils.face_detection import FaceDetector
+
+# Optional CPU inference dependencies, the local engine is disabled without them
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# S3 bucket name
+s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
+
+
+class OnnxEmbeddingModel:
+    """
+    Face embedding model running on CPU through onnxruntime.
+
+    The model must take one NCHW float32 image of an aligned face and return
+    one embedding vector (ArcFace / FaceNet style exports).
+    """
+    def __init__(self, model_path, input_size=112):
+        self.session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Use the size baked into the model when the export has a static shape
+        self.input_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else input_size
+
+    def embed(self, face):
+        # `face`: aligned RGB crop from FaceDetector.align
+        if face.shape[0] != self.input_size:
+            face = np.asarray(Image.fromarray(face).resize((self.input_size, self.input_size)))
+        pixels = (face.astype(np.float32) - 127.5) / 128.0
+        tensor = pixels.transpose(2, 0, 1)[np.newaxis, ...]
+        embedding = self.session.run(None, {self.input_name: tensor})[0][0].astype(np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+
+class DeviceFaceIndex:
+    """
+    In-memory embedding matrix of the employees of one device.
+
+    Rows are L2 normalised so a single matrix-vector product gives the
+    cosine similarity against every employee.
+    """
+    def __init__(self, face_ids, matrix):
+        # Swapped as one tuple so readers never see ids and rows out of sync
+        self.entries = (face_ids, matrix)
+        self.built_at = time.time()
+        self.lock = threading.Lock()
+
+    def search(self, embedding):
+        face_ids, matrix = self.entries
+        if not face_ids:
+            return None, 0.0
+
+        scores = matrix @ embedding
+        best = int(np.argmax(scores))
+        return face_ids[best], float(scores[best])
+
+    def add(self, face_id, embedding):
+        with self.lock:
+            face_ids, matrix = self.entries
+            if face_id in face_ids:
+                return
+            row = embedding[np.newaxis, :]
+            self.entries = (face_ids + [face_id], np.vstack([matrix, row]) if matrix.size else row)
+
+
+class LocalRecognitionService:
+    """
+    Embeddings are computed from the aligned face crop (FaceDetector), both
+    for the registration photos and the frames, so a confident local match
+    is accepted without calling Rekognition. Frames without a detected face
+    or below MATCH_THRESHOLD go to the Rekognition collection search.
+    """
+    MODEL_PATH = os.environ.get('LOCAL_RECOGNITION_MODEL_PATH')
+    MATCH_THRESHOLD = float(os.environ.get('LOCAL_RECOGNITION_THRESHOLD', 0.6))
+    INDEX_TTL = int(os.environ.get('LOCAL_RECOGNITION_INDEX_TTL', 900))  # in seconds
+    BUILD_WORKERS = int(os.environ.get('LOCAL_RECOGNITION_BUILD_WORKERS', 8))
+
+    model = None
+    indexes = {}
+    build_locks = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled():
+        return (
+            bool(LocalRecognitionService.MODEL_PATH) and np is not None and onnxruntime is not None
+            and FaceDetector.is_enabled()
+        )
+    @staticmethod
+    def get_model():
+        if LocalRecognitionService.model is None:
+            with LocalRecognitionService.lock:
+                if LocalRecognitionService.model is None:
+                    LocalRecognitionService.model = OnnxEmbeddingModel(LocalRecognitionService.MODEL_PATH)
+        return LocalRecognitionService.model
+
+    @staticmethod
+    def get_index(device_id):
+        index = LocalRecognitionService.indexes.get(device_id)
+        if index and time.time() - index.built_at < LocalRecognitionService.INDEX_TTL:
+            return index
+
+        with LocalRecognitionService.lock:
+            build_lock = LocalRecognitionService.build_locks.setdefault(device_id, threading.Lock())
+
+        # Only one request per device rebuilds, the others wait for its result
+        with build_lock:
+            index = LocalRecognitionService.indexes.get(device_id)
+            if index and time.time() - index.built_at < LocalRecognitionService.INDEX_TTL:
+                return index
+
+            index = LocalRecognitionService.build_index(device_id)
+            LocalRecognitionService.indexes[device_id] = index
+            return index
+
+    @staticmethod
+    def build_index(device_id):
+        """
+        Build the embedding matrix of a device from the employee images
+        already stored under `{device_id}/...` in the employees bucket.
+        """
+        model = LocalRecognitionService.get_model()
+        device_users = [
+            user for user in UserRepository.find_users_device(device_id)
+            if user.get("role") != Role.ADMIN.value
+            and user.get("status") == UserAccountStatus.ACTIVE.value
+            and (user.get("face_image") or user.get("image"))
+        ]
+
+        def load_embedding(user):
+            # `image` may later be replaced by an avatar, `face_image` keeps the registration photo
+            image_key = user.get("face_image") or user["image"]
+            image_data = S3Service.get_object(s3_bucket_employees, image_key)
+            if not image_data:
+                return None
+            try:
+                face = FaceDetector.align(image_data)
+                if face is None:
+                    print(f"No face found in {image_key}")
+                    return None
+                return model.embed(face)
+            except Exception as e:
+                print(f"Failed to embed {image_key}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=LocalRecognitionService.BUILD_WORKERS) as executor:
+            embeddings = list(executor.map(load_embedding, device_users))
+
+        face_ids = []
+        rows = []
+        for user, embedding in zip(device_users, embeddings):
+            if embedding is not None:
+                face_ids.append(user["id"])
+                rows.append(embedding)
+
+        matrix = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        print(f"Built local face index for device {device_id}: {len(face_ids)} employees")
+        return DeviceFaceIndex(face_ids, matrix)
+
+    @staticmethod
+    def invalidate(device_id):
+        LocalRecognitionService.indexes.pop(device_id, None)
+
+    @staticmethod
+    def authenticate(device_id, collection_id, image_data, face):
+        """
+        Match the face against the local index of the device and fall back to
+        Rekognition when the local engine is disabled, finds no face or is not
+        confident enough.
+
+        Args:
+            face: Aligned crop of `image_data` from FaceDetector.try_align,
+                shared with the frame cache, None when no face was found.
+
+        Returns:
+            str | bool: The matched face id, False when nobody matched.
+        """
+        embedding = None
+        index = None
+        if face is not None and LocalRecognitionService.is_enabled():
+            try:
+                embedding = LocalRecognitionService.get_model().embed(face)
+                index = LocalRecognitionService.get_index(device_id)
+                face_id, score = index.search(embedding)
+                if face_id and score >= LocalRecognitionService.MATCH_THRESHOLD:
+                    return face_id
+            except Exception as e:
+                print(f"Local recognition failed, falling back to Rekognition: {e}")
+
+        face_id = RekognitionService.authenticate(collection_id, image_data)
+
+        # Remember the confirmed face so the next check-in is served locally
+        if face_id and embedding is not None and index is not None:
+            index.add(face_id, embedding)
+
+        return face_id
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from ...repositories.attendance_daily_repository import AttendanceDailyRepository
+from ...repositories.history_repository import HistoryRepository
+from .rebuild_attendance_daily import iter_dates
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily attendance roll-up of the dates not marked complete yet, the daily views read "
+        "the raw history until then. Run it once after enabling the roll-up, then daily to mark the next days"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start_date', required=True, help="First date, YYYY-MM-DD")
+        parser.add_argument('--to', dest='end_date', help="Last date with history, YYYY-MM-DD, defaults to today")
+        parser.add_argument('--days-ahead', type=int, default=1,
+                            help="Also mark the next days complete, the history writer fills them as events arrive")
+
+    def handle(self, *args, **options):
+        if not AttendanceDailyRepository.is_enabled():
+            raise CommandError("AWS_DYNAMODB_TABLE_ATTENDANCE_DAILY is not set")
+
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d')
+            end_date = (
+                datetime.strptime(options['end_date'], '%Y-%m-%d') if options['end_date']
+                else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            )
+        except ValueError:
+            raise CommandError("Dates must be YYYY-MM-DD")
+
+        backfilled = 0
+        for date in iter_dates(start_date, end_date + timedelta(days=max(options['days_ahead'], 0))):
+            if AttendanceDailyRepository.is_complete(date):
+                continue
+            written = AttendanceDailyRepository.replace_date(date, HistoryRepository.get_histories_by_date(date))
+            self.stdout.write(f"{date}: {written} employees")
+            backfilled += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {backfilled} dates"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from ...repository import UserRepository
+from ...repositories.user_repository import user_table, build_guards, GUARD_PREFIXES
+
+
+class Command(BaseCommand):
+    help = "Write the username, RFID and master account guard items of the users registered before they existed"
+
+    def handle(self, *args, **options):
+        created = 0
+        conflicts = []
+        scan_params = {}
+        while True:
+            response = user_table.scan(**scan_params)
+            for user in response["Items"]:
+                # Skip the guard items themselves
+                if "guard" in user:
+                    continue
+
+                for field, value in build_guards(user).items():
+                    if UserRepository.create_guard(field, value, user["id"]):
+                        created += 1
+                        continue
+
+                    claimed_by = user_table.get_item(Key={'id': f"{GUARD_PREFIXES[field]}{value}"}).get("Item", {})
+                    if claimed_by.get("user_id") != user["id"]:
+                        conflicts.append((field, value, user["id"], claimed_by.get("user_id")))
+
+            if "LastEvaluatedKey" not in response:
+                break
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        for field, value, user_id, owner_id in conflicts:
+            self.stdout.write(self.style.WARNING(f"{field} {value} of user {user_id} is already claimed by {owner_id}"))
+        self.stdout.write(self.style.SUCCESS(f"Created {created} guards, {len(conflicts)} conflicts"))
@@ -0,0 +1,39 @@
+import statistics
+import time
+import bcrypt
+from django.core.management.base import BaseCommand
+from ...ultils.password_hasher import BCRYPT_ROUNDS
+
+
+class Command(BaseCommand):
+    help = "Time bcrypt on this machine and suggest the BCRYPT_ROUNDS giving a target hash time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help="Acceptable time of one hash")
+        parser.add_argument('--samples', type=int, default=3, help="Hashes timed per cost factor")
+        parser.add_argument('--min-rounds', type=int, default=10)
+        parser.add_argument('--max-rounds', type=int, default=16)
+
+    def handle(self, *args, **options):
+        password = b"calibration-password"
+        suggested = options['min_rounds']
+
+        for rounds in range(options['min_rounds'], options['max_rounds'] + 1):
+            salt = bcrypt.gensalt(rounds=rounds)
+            timings = []
+            for _ in range(options['samples']):
+                start = time.perf_counter()
+                bcrypt.hashpw(password, salt)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            median_ms = statistics.median(timings)
+            self.stdout.write(f"rounds={rounds:>2} median={median_ms:8.1f} ms")
+            if median_ms > options['target_ms']:
+                break
+            suggested = rounds
+
+        self.stdout.write(f"Current BCRYPT_ROUNDS={BCRYPT_ROUNDS}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Suggested BCRYPT_ROUNDS={suggested} for {options['target_ms']:.0f} ms per hash, "
+            "existing hashes are upgraded at the next login"
+        ))
@@ -0,0 +1,74 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ...repositories.user_repository import user_table, user_table_name, USER_INDEXES, index_status
+
+
+class Command(BaseCommand):
+    help = "Create the secondary indexes of the user table and check that they serve queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-wait', action='store_true', help="Start at most one index creation and exit")
+        parser.add_argument('--poll-interval', type=int, default=15, help="Seconds between status checks")
+
+    def describe_indexes(self):
+        table = user_table.meta.client.describe_table(TableName=user_table_name)["Table"]
+        return table, {index["IndexName"]: index for index in table.get("GlobalSecondaryIndexes", [])}
+
+    def create_index(self, table, attribute, index_name):
+        index = {
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': attribute, 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'},
+        }
+        throughput = table.get("ProvisionedThroughput", {})
+        if table.get("BillingModeSummary", {}).get("BillingMode") != "PAY_PER_REQUEST" and throughput.get("ReadCapacityUnits"):
+            index['ProvisionedThroughput'] = {
+                'ReadCapacityUnits': throughput["ReadCapacityUnits"],
+                'WriteCapacityUnits': throughput["WriteCapacityUnits"],
+            }
+
+        # DynamoDB creates one global secondary index per UpdateTable call
+        user_table.meta.client.update_table(
+            TableName=user_table_name,
+            AttributeDefinitions=[{'AttributeName': attribute, 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{'Create': index}]
+        )
+        self.stdout.write(f"Creating {index_name} on {attribute}")
+
+    def handle(self, *args, **options):
+        while True:
+            table, indexes = self.describe_indexes()
+            pending = [name for name in USER_INDEXES.values() if indexes.get(name, {}).get("IndexStatus") != "ACTIVE"]
+            in_progress = [name for name in pending if name in indexes]
+
+            if not pending:
+                break
+
+            if not in_progress and table["TableStatus"] == "ACTIVE":
+                attribute, index_name = next((a, n) for a, n in USER_INDEXES.items() if n in pending)
+                self.create_index(table, attribute, index_name)
+                in_progress = [index_name]
+
+            if options['no_wait']:
+                self.stdout.write(f"Indexes not ready yet: {', '.join(pending)}, run the command again later")
+                return
+
+            self.stdout.write(f"Waiting for {', '.join(in_progress) or user_table_name}...")
+            time.sleep(options['poll_interval'])
+
+        # Validate every index with a real query
+        for attribute, index_name in USER_INDEXES.items():
+            key_schema = indexes[index_name]["KeySchema"]
+            if key_schema != [{'AttributeName': attribute, 'KeyType': 'HASH'}]:
+                raise CommandError(f"{index_name} has an unexpected key schema: {key_schema}")
+            user_table.query(
+                IndexName=index_name,
+                KeyConditionExpression="#key = :value",
+                ExpressionAttributeNames={'#key': attribute},
+                ExpressionAttributeValues={':value': '__ensure_user_indexes__'},
+                Limit=1
+            )
+            self.stdout.write(self.style.SUCCESS(f"{index_name}: ACTIVE, {indexes[index_name].get('ItemCount', 0)} items"))
+
+        # Let this process pick the indexes up right away
+        index_status["checked_at"] = 0
@@ -0,0 +1,57 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from ...image_store import IMAGE_TOMBSTONE_TTL
+from ...image_variants import ImageVariantService
+from ...repository import UserRepository, HistoryRepository
+from ...services import S3Service
+
+s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
+
+
+class Command(BaseCommand):
+    help = "Delete the employee images and variants that no user has referenced for the grace period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Keep images released more recently than this, an upload may still be in flight")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the images that would be deleted")
+
+    def handle(self, *args, **options):
+        released_before = time.time() - options['grace_hours'] * 3600
+        candidates = UserRepository.find_unreferenced_images(released_before)
+        # Check-in records keep the key of the photo the employee had at the time
+        in_history = HistoryRepository.find_referenced_images()
+        image_keys = [image_key for image_key in candidates if image_key not in in_history]
+        self.stdout.write(
+            f"{len(candidates)} unreferenced images, {len(candidates) - len(image_keys)} kept for the history"
+        )
+
+        if options['dry_run']:
+            for image_key in image_keys:
+                self.stdout.write(image_key)
+            return
+
+        # Tombstone, delete the objects, then drop the references still tombstoned.
+        # A registration of the same bytes meanwhile waits and uploads them again
+        deleting_at = int(time.time())
+        stale_before = deleting_at - IMAGE_TOMBSTONE_TTL
+        released = 0
+        deleted = 0
+        for offset in range(0, len(image_keys), 1000):
+            marked_keys = [
+                image_key for image_key in image_keys[offset:offset + 1000]
+                if UserRepository.mark_image_deleting(image_key, deleting_at, stale_before)
+            ]
+            object_keys = []
+            for image_key in marked_keys:
+                object_keys.append(image_key)
+                object_keys.extend(
+                    ImageVariantService.variant_key(image_key, name) for name, _ in ImageVariantService.VARIANTS
+                )
+            deleted += S3Service.delete_objects(s3_bucket_employees, object_keys)
+            released += sum(
+                1 for image_key in marked_keys if UserRepository.delete_image_reference(image_key, deleting_at)
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} objects for {released} images"))
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from ...image_variants import ImageVariantService
+from ...repositories.user_repository import user_table
+
+
+class Command(BaseCommand):
+    help = "Generate the small and medium variants of the employee images that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that are already up to date")
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        users = []
+        scan_params = {
+            'ProjectionExpression': 'id, image, image_variants'
+        }
+        while True:
+            response = user_table.scan(**scan_params)
+            for user in response["Items"]:
+                if not user.get("image"):
+                    continue
+                is_up_to_date = user.get("image_variants", {}).get("source") == user["image"]
+                if options['force'] or not is_up_to_date:
+                    users.append(user)
+
+            if "LastEvaluatedKey" not in response:
+                break
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        self.stdout.write(f"{len(users)} images to process")
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(lambda user: ImageVariantService.generate(user["id"], user["image"]), users))
+
+        failed = [user["id"] for user, is_done in zip(users, results) if not is_done]
+        for user_id in failed:
+            self.stdout.write(self.style.WARNING(f"Failed to generate the variants of user {user_id}"))
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {len(users) - len(failed)}/{len(users)} users"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...employee_import import EmployeeImportService
+
+
+class Command(BaseCommand):
+    help = "Register the employees of a device from a CSV manifest and a ZIP of photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('registor_id', help="Id of the host account the employees are added to")
+        parser.add_argument('manifest', help="Path of the CSV manifest")
+        parser.add_argument('photos', help="Path of the ZIP archive holding the photos")
+
+    def handle(self, *args, **options):
+        with open(options['manifest'], 'rb') as manifest_file, open(options['photos'], 'rb') as photos_file:
+            import_response = EmployeeImportService.import_employees(options['registor_id'], manifest_file, photos_file)
+
+        if not import_response["isSuccess"]:
+            raise CommandError(import_response["message"])
+
+        for row_report in import_response["report"]:
+            status = "OK" if row_report["isSuccess"] else "FAILED"
+            self.stdout.write(f"{row_report['row']:>5} {status:<6} {row_report['username']}: {row_report['message']}")
+        self.stdout.write(self.style.SUCCESS(import_response["message"]))
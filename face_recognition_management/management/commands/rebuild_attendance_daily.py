@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from ...repositories.attendance_daily_repository import AttendanceDailyRepository
+from ...repositories.history_repository import HistoryRepository
+
+
+def iter_dates(start_date, end_date):
+    date = start_date
+    while date <= end_date:
+        yield date.strftime('%Y-%m-%d')
+        date += timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily attendance roll-up from the raw history, e.g. to backfill it or after a replayed upload"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start_date', required=True, help="First date, YYYY-MM-DD")
+        parser.add_argument('--to', dest='end_date', help="Last date, YYYY-MM-DD, defaults to --from")
+
+    def handle(self, *args, **options):
+        if not AttendanceDailyRepository.is_enabled():
+            raise CommandError("AWS_DYNAMODB_TABLE_ATTENDANCE_DAILY is not set")
+
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d')
+            end_date = datetime.strptime(options['end_date'] or options['start_date'], '%Y-%m-%d')
+        except ValueError:
+            raise CommandError("Dates must be YYYY-MM-DD")
+
+        for date in iter_dates(start_date, end_date):
+            written = AttendanceDailyRepository.replace_date(date, HistoryRepository.get_histories_by_date(date))
+            self.stdout.write(f"{date}: {written} employees")
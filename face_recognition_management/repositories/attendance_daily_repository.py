@@ -0,0 +1,216 @@
+import boto3
+import os
+import time
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+dynamodb_client = boto3.resource('dynamodb', os.environ.get('AWS_REGION'))
+# DynamoDB table name, keyed by (created_date, id). Without it the daily views
+# read the raw history instead
+attendance_daily_table_name = os.environ.get('AWS_DYNAMODB_TABLE_ATTENDANCE_DAILY')
+attendance_daily_table = dynamodb_client.Table(attendance_daily_table_name) if attendance_daily_table_name else None
+
+# Fields of the first history row of the day, kept as they are
+FIRST_EVENT_FIELDS = ['created_at', 'authenticate_with', 'employee_information', 'check_in', 'status']
+# Sort key of the item marking a date as rebuilt from the raw history, from
+# then on the history writer keeps it complete
+COMPLETE_MARKER_ID = '#complete'
+# How long a date seen complete is trusted before the marker is read again,
+# another process may have cleared it
+COMPLETE_MARKER_TTL = 60  # in seconds
+
+
+def summarize(histories):
+    """
+    Group history rows by (created_date, id).
+
+    Returns:
+        dict: (date, user id) -> (first row, last row, number of rows).
+    """
+    summaries = {}
+    for history in histories:
+        key = (history['created_date'], history['id'])
+        if key not in summaries:
+            summaries[key] = (history, history, 1)
+            continue
+        first, last, count = summaries[key]
+        summaries[key] = (
+            min(first, history, key=lambda item: item['created_at']),
+            max(last, history, key=lambda item: item['created_at']),
+            count + 1
+        )
+    return summaries
+
+
+def build_attendance(first, last, count):
+    return {
+        'created_date': first['created_date'],
+        'id': first['id'],
+        **{field: first[field] for field in FIRST_EVENT_FIELDS if field in first},
+        'last_event_at': last['created_at'],
+        'last_status': last.get('status'),
+        'last_authenticate_with': last.get('authenticate_with'),
+        'event_count': count
+    }
+
+
+class AttendanceDailyRepository:
+    """
+    One item per employee and day: the first check-in (stored with the same
+    fields as a history row), the last event and the number of events. It is
+    updated from the history writer as rows are flushed, the daily views read
+    a few hundred of these instead of every event of the day.
+
+    A date is only read from here once `replace_date` has marked it complete
+    (see `manage.py backfill_attendance_daily`), events written before the
+    roll-up existed or while it was disabled are missing otherwise. An event
+    that can't be applied clears the marker of its date, which goes back to
+    the raw history until the next backfill rebuilds it.
+    """
+    # Date -> when its marker was last seen
+    complete_dates = {}
+
+    @staticmethod
+    def is_enabled():
+        return attendance_daily_table is not None
+
+    @staticmethod
+    def is_complete(date):
+        if time.time() - AttendanceDailyRepository.complete_dates.get(date, 0) < COMPLETE_MARKER_TTL:
+            return True
+        response = attendance_daily_table.get_item(
+            Key={'created_date': date, 'id': COMPLETE_MARKER_ID},
+            ProjectionExpression='created_date'
+        )
+        if 'Item' not in response:
+            AttendanceDailyRepository.complete_dates.pop(date, None)
+            return False
+        AttendanceDailyRepository.complete_dates[date] = time.time()
+        return True
+
+    @staticmethod
+    def record(histories):
+        if not AttendanceDailyRepository.is_enabled():
+            return
+        for first, last, count in summarize(histories).values():
+            try:
+                AttendanceDailyRepository.apply(first, last, count)
+            except ClientError as e:
+                print(f"Failed to update the attendance of {first['id']} on {first['created_date']}: {e}")
+                # The boto3 retries are spent and the update may be half applied, reads of the
+                # date fall back to the raw history instead of missing the event
+                AttendanceDailyRepository.mark_incomplete(first['created_date'])
+
+    @staticmethod
+    def mark_incomplete(date):
+        AttendanceDailyRepository.complete_dates.pop(date, None)
+        try:
+            attendance_daily_table.delete_item(Key={'created_date': date, 'id': COMPLETE_MARKER_ID})
+        except ClientError as e:
+            print(f"Failed to clear the complete marker of {date}, rebuild it: {e}")
+
+    @staticmethod
+    def apply(first, last, count):
+        key = {'created_date': first['created_date'], 'id': first['id']}
+        first_fields = [field for field in FIRST_EVENT_FIELDS if field in first]
+        # `status` is a reserved word, every field goes through a name placeholder
+        first_names = {f'#{field}': field for field in first_fields}
+        first_values = {f':{field}': first[field] for field in first_fields}
+        last_values = {
+            ':last_event_at': last['created_at'],
+            ':last_status': last.get('status'),
+            ':last_authenticate_with': last.get('authenticate_with')
+        }
+        set_last = 'last_event_at = :last_event_at, last_status = :last_status, last_authenticate_with = :last_authenticate_with'
+
+        try:
+            # Events usually arrive in order: keep the stored first check-in and move the last event.
+            # Rows older than the stored first check-in fail the condition
+            attendance_daily_table.update_item(
+                Key=key,
+                UpdateExpression='SET ' + ', '.join(
+                    [f'#{field} = if_not_exists(#{field}, :{field})' for field in first_fields] + [set_last]
+                ) + ' ADD event_count :count',
+                ConditionExpression=(
+                    'attribute_not_exists(created_date) '
+                    'OR (last_event_at <= :last_event_at AND #created_at <= :created_at)'
+                ),
+                ExpressionAttributeNames=first_names,
+                ExpressionAttributeValues={**first_values, **last_values, ':count': count}
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+        # Late events, e.g. an offline device uploading its backlog: count them,
+        # then move each end of the day only if they extend it
+        attendance_daily_table.update_item(
+            Key=key,
+            UpdateExpression='ADD event_count :count',
+            ExpressionAttributeValues={':count': count}
+        )
+        AttendanceDailyRepository.update_if(
+            key,
+            'SET ' + ', '.join(f'#{field} = :{field}' for field in first_fields),
+            '#created_at > :created_at',
+            first_names,
+            first_values
+        )
+        AttendanceDailyRepository.update_if(key, 'SET ' + set_last, 'last_event_at < :last_event_at', None, last_values)
+
+    @staticmethod
+    def update_if(key, update_expression, condition_expression, names, values):
+        params = {
+            'Key': key,
+            'UpdateExpression': update_expression,
+            'ConditionExpression': condition_expression,
+            'ExpressionAttributeValues': values
+        }
+        if names:
+            params['ExpressionAttributeNames'] = names
+        try:
+            attendance_daily_table.update_item(**params)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    @staticmethod
+    def get_by_date(date):
+        """
+        Attendance of every employee on `date`, ordered by first check-in.
+        """
+        items = []
+        query_params = {
+            'KeyConditionExpression': Key('created_date').eq(date)
+        }
+        while True:
+            response = attendance_daily_table.query(**query_params)
+            items.extend(item for item in response['Items'] if item['id'] != COMPLETE_MARKER_ID)
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return sorted(items, key=lambda item: item.get('created_at', ''))
+
+    @staticmethod
+    def replace_date(date, histories):
+        """
+        Rebuild the attendance of `date` from all of its history rows and mark
+        the date complete.
+
+        Returns:
+            int: Number of attendance items written.
+        """
+        attendances = [build_attendance(*summary) for summary in summarize(histories).values()]
+        stale_ids = {item['id'] for item in AttendanceDailyRepository.get_by_date(date)}
+        stale_ids -= {attendance['id'] for attendance in attendances}
+
+        with attendance_daily_table.batch_writer() as batch:
+            for attendance in attendances:
+                batch.put_item(Item=attendance)
+            for user_id in stale_ids:
+                batch.delete_item(Key={'created_date': date, 'id': user_id})
+        # Written last, a rebuild that fails halfway leaves the date on the raw history
+        attendance_daily_table.put_item(Item={'created_date': date, 'id': COMPLETE_MARKER_ID})
+        AttendanceDailyRepository.complete_dates[date] = time.time()
+        return len(attendances)
@@ -0,0 +1,57 @@
+import boto3
+import os
+from datetime import datetime
+from boto3.dynamodb.conditions import Attr
+
+dynamodb_client = boto3.resource('dynamodb', os.environ.get('AWS_REGION'))
+# DynamoDB table name. Without it revoked tokens are only kept in the memory
+# of the process that revoked them
+black_list_table_name = os.environ.get('AWS_DYNAMODB_TABLE_BLACK_LIST')
+black_list_table = dynamodb_client.Table(black_list_table_name) if black_list_table_name else None
+
+
+class BlackListRepository:
+    @staticmethod
+    def is_enabled():
+        return black_list_table is not None
+
+    @staticmethod
+    def create(token_digest, user_id, reason, expires_at):
+        """
+        Revoke a token. Only its SHA-256 digest is stored, `expires_at` (epoch
+        seconds) can be used as the table TTL attribute since an expired token
+        is rejected anyway.
+        """
+        current_time = datetime.now().isoformat()
+        item = {
+            'token': token_digest,
+            'user_id': user_id,
+            'reason': reason,
+            'expires_at': int(expires_at),
+            'created_at': current_time,
+            'updated_at': current_time
+        }
+        if BlackListRepository.is_enabled():
+            black_list_table.put_item(Item=item)
+        return item
+
+    @staticmethod
+    def find_revoked_tokens(now):
+        """
+        Digests of the revoked tokens that have not expired yet, read in one
+        paginated scan.
+        """
+        digests = set()
+        if not BlackListRepository.is_enabled():
+            return digests
+        scan_params = {
+            'ProjectionExpression': '#token',
+            'ExpressionAttributeNames': {'#token': 'token'},
+            'FilterExpression': Attr('expires_at').gt(int(now))
+        }
+        while True:
+            response = black_list_table.scan(**scan_params)
+            digests.update(item["token"] for item in response["Items"])
+            if "LastEvaluatedKey" not in response:
+                return digests
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
@@ -0,0 +1,189 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from botocore.exceptions import ClientError
+
+# DynamoDB accepts at most 25 put requests per BatchWriteItem call
+BATCH_WRITE_LIMIT = 25
+
+WRITE_BEHIND_ENABLED = os.environ.get('DYNAMODB_WRITE_BEHIND', 'true').lower() == 'true'
+
+
+class BufferedTableWriter:
+    """
+    Write-behind buffer for append-only tables.
+
+    Items are queued in memory and written by a background thread with
+    BatchWriteItem once `max_batch` items are waiting or `flush_interval`
+    seconds have passed, and on interpreter shutdown. Unprocessed items
+    are retried `max_retries` times with exponential backoff. Items that
+    could not reach DynamoDB at all (connection errors, timeouts) go back
+    on the queue for the next flush, items it rejected are counted as
+    failed. `on_write` is
+    called with the items once they are stored, e.g. to maintain aggregates.
+    """
+    def __init__(self, table, key_names, max_batch=BATCH_WRITE_LIMIT, flush_interval=1.0,
+                 max_retries=5, max_queue=10000, enabled=WRITE_BEHIND_ENABLED, on_write=None):
+        self.table = table
+        self.key_names = key_names
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self.on_write = on_write
+
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+        self.exit_registered = False
+
+        self.stats = {
+            "flushed_items": 0,
+            "failed_items": 0,
+            "requeued_items": 0,
+            "flush_count": 0,
+            "retry_count": 0,
+            "last_flush_latency_ms": 0.0,
+            "max_flush_latency_ms": 0.0,
+        }
+
+    def put(self, item):
+        # Full buffer or stopped writer: apply backpressure with a direct write
+        if not self.enabled or self.closed or len(self.queue) >= self.max_queue:
+            self.table.put_item(Item=item)
+            self.written([item])
+            return item
+
+        with self.condition:
+            self.queue.append(item)
+            # A flusher that died on an unexpected error is replaced
+            if self.thread is None or not self.thread.is_alive():
+                self.start()
+            if len(self.queue) >= self.max_batch:
+                self.condition.notify()
+        return item
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"write-behind-{self.table.name}", daemon=True)
+        self.thread.start()
+        if not self.exit_registered:
+            atexit.register(self.close)
+            self.exit_registered = True
+
+    def run(self):
+        while not self.closed:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: len(self.queue) >= self.max_batch or self.closed,
+                    timeout=self.flush_interval
+                )
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep flushing, the items of this round were requeued or counted
+                print(f"Flush of {self.table.name} failed: {e}")
+
+    def flush(self):
+        with self.flush_lock:
+            with self.condition:
+                items = list(self.queue)
+                self.queue.clear()
+
+            if not items:
+                return
+
+            start = time.monotonic()
+            unsent = []
+            for offset in range(0, len(items), BATCH_WRITE_LIMIT):
+                unsent.extend(self.write_batch(items[offset:offset + BATCH_WRITE_LIMIT]))
+            if unsent:
+                self.requeue(unsent)
+
+            latency_ms = (time.monotonic() - start) * 1000
+            self.stats["flush_count"] += 1
+            self.stats["last_flush_latency_ms"] = round(latency_ms, 2)
+            self.stats["max_flush_latency_ms"] = max(self.stats["max_flush_latency_ms"], round(latency_ms, 2))
+
+    def write_batch(self, items):
+        """
+        Returns:
+            list: Items to write again on the next flush, DynamoDB could not be reached.
+        """
+        # BatchWriteItem rejects two requests for the same key, keep the last one
+        unique_items = {tuple(item[key] for key in self.key_names): item for item in items}
+        requests = [{'PutRequest': {'Item': item}} for item in unique_items.values()]
+
+        attempt = 0
+        is_unreachable = False
+        while requests:
+            try:
+                response = self.table.meta.client.batch_write_item(RequestItems={self.table.name: requests})
+                requests = response.get('UnprocessedItems', {}).get(self.table.name, [])
+                is_unreachable = False
+            except ClientError as e:
+                print(f"Batch write to {self.table.name} failed: {e}")
+                is_unreachable = False
+            except Exception as e:
+                # BotoCoreError and the like: nothing was written, the request never got an answer
+                print(f"Batch write to {self.table.name} failed: {e}")
+                is_unreachable = True
+
+            if not requests:
+                break
+
+            attempt += 1
+            if attempt > self.max_retries:
+                unwritten = [request['PutRequest']['Item'] for request in requests]
+                unwritten_keys = {tuple(item[key] for key in self.key_names) for item in unwritten}
+                self.stats["flushed_items"] += len(unique_items) - len(requests)
+                self.written([item for key, item in unique_items.items() if key not in unwritten_keys])
+                if is_unreachable:
+                    print(f"Requeueing {len(requests)} items for {self.table.name} after {self.max_retries} retries")
+                    return unwritten
+                print(f"Dropping {len(requests)} items for {self.table.name} after {self.max_retries} retries")
+                self.stats["failed_items"] += len(requests)
+                return []
+
+            self.stats["retry_count"] += 1
+            time.sleep(min(0.05 * (2 ** attempt), 2))
+
+        self.stats["flushed_items"] += len(unique_items)
+        self.written(list(unique_items.values()))
+        return []
+
+    def requeue(self, items):
+        with self.condition:
+            room = max(self.max_queue - len(self.queue), 0)
+            # Back at the front, in their original order, as far as the queue has room
+            self.queue.extendleft(reversed(items[:room]))
+            self.stats["requeued_items"] += min(len(items), room)
+        if len(items) > room:
+            print(f"Dropping {len(items) - room} items for {self.table.name}, the queue is full")
+            self.stats["failed_items"] += len(items) - room
+
+    def written(self, items):
+        if not self.on_write or not items:
+            return
+        try:
+            self.on_write(items)
+        except Exception as e:
+            print(f"Write hook of {self.table.name} failed: {e}")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        # Whatever is still queued is written before the process exits
+        self.flush()
+
+    def metrics(self):
+        return {
+            "table": self.table.name,
+            "queue_depth": len(self.queue),
+            **self.stats,
+        }
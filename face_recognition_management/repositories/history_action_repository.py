@@ -2,10 +2,12 @@ import boto3
 import os
 from boto3.dynamodb.conditions import Key
 from datetime import datetime, timedelta
+from .buffered_writer import BufferedTableWriter
 dynamodb_client = boto3.resource('dynamodb', os.environ.get('AWS_REGION'))
 # DynamoDB table name
 history_action_table_name = os.environ.get('AWS_DYNAMODB_TABLE_HISTORY_ACTION')
 history_action_table = dynamodb_client.Table(history_action_table_name)
+history_action_writer = BufferedTableWriter(history_action_table, key_names=['device_id_user_id', 'created_at'])
 
 class HistoryActionRepository:
     @staticmethod
@@ -19,8 +21,7 @@ class HistoryActionRepository:
             'action': action,
             'updated_at': created_at  
         }
-        history_action_table.put_item(Item=item)
-        return item
+        return history_action_writer.put(item)
     
     @staticmethod
     def get_history(device_id, user_id, date):
@@ -4,11 +4,20 @@ from boto3.dynamodb.conditions import Key
 from datetime import datetime, timedelta
 import random
 import string
+from .buffered_writer import BufferedTableWriter
+from .attendance_daily_repository import AttendanceDailyRepository, summarize, build_attendance
+from .paginator import paginate, QUERY_PAGE_SIZE, QUERY_PREFETCH
 
 dynamodb_client = boto3.resource('dynamodb', os.environ.get('AWS_REGION'))
 # DynamoDB table name
 history_table_name = os.environ.get('AWS_DYNAMODB_TABLE_HISTORY')
 history_table = dynamodb_client.Table(history_table_name)
+# Check-ins are append-only, write them behind the request
+history_writer = BufferedTableWriter(
+    history_table, key_names=['id', 'created_at'],
+    # Keeps the daily roll-up in step with every flushed check-in
+    on_write=AttendanceDailyRepository.record
+)
 
 def generate_random_string(length=10):
         """Generate a random string of fixed length."""
@@ -32,11 +41,12 @@ def create_history_item(device_id, item_number):
 
 class HistoryRepository:
     @staticmethod
-    def create_history(user_id, user_information, authenticate_with, status = "Check In"):
-        timestamp = datetime.now() 
+    def build_history(user_id, user_information, authenticate_with, status = "Check In", timestamp=None):
+        # `timestamp`: when the device captured the event, defaults to now
+        timestamp = timestamp or datetime.now()
         created_at = timestamp.strftime('%Y-%m-%dT%H:%M:%S')  
         created_date = timestamp.strftime('%Y-%m-%d')
-        item = {
+        return {
             'id': user_id,
             'created_at': created_at,
             'authenticate_with': authenticate_with,
@@ -45,34 +55,26 @@ class HistoryRepository:
             'check_in': True, # Present or absent
             'status': status
         }
-        history_table.put_item(Item=item)
-        return item
 
     @staticmethod
-    def get_history_of_device(device_id, limit=20, page=1, start_key=None):
-        # Tính số lượng mục cần bỏ qua
-        start_from = (page - 1) * limit
+    def create_history(user_id, user_information, authenticate_with, status = "Check In"):
+        item = HistoryRepository.build_history(user_id, user_information, authenticate_with, status)
+        return history_writer.put(item)
 
-        if page > 1 and not start_key:
-            # Bước 1: Truy vấn để lấy đủ số lượng mục để bỏ qua
-            response = history_table.query(
-                KeyConditionExpression=Key('id').eq(device_id),
-                ScanIndexForward=False,  # Sắp xếp giảm dần theo created_at
-                Limit=start_from + limit  # Lấy số lượng mục để bỏ qua và thêm limit
-            )
-            
-            # Nếu không có đủ dữ liệu để lấy số lượng cần thiết
-            if not response['Items']:
-                return [], None
-            
-            # Lấy LastEvaluatedKey từ kết quả, nếu có
-            start_key = response.get('LastEvaluatedKey', None)
-            
-            if start_key is None and len(response['Items']) < start_from + limit:
-                # Nếu không có LastEvaluatedKey và số lượng mục ít hơn start_from + limit, nghĩa là không đủ dữ liệu
-                return [], None
-            
-        # Bước 2: Truy vấn từ phần tử thứ (start_from) trở đi
+    @staticmethod
+    def create_histories(items):
+        # Rows of the same user in the same second share a key, the writer keeps the last one
+        for item in items:
+            history_writer.put(item)
+        history_writer.flush()
+        return items
+
+    @staticmethod
+    def get_history_of_device(device_id, limit=20, start_key=None):
+        """
+        One page of the history, newest first. Pass the returned key back as
+        `start_key` for the next page, each page is a single `limit` query.
+        """
         query_params = {
             'KeyConditionExpression': Key('id').eq(device_id),
             'ScanIndexForward': False,  # Sắp xếp giảm dần theo created_at
@@ -90,32 +92,10 @@ class HistoryRepository:
         return items, last_evaluated_key
 
     @staticmethod
-    def get_history_by_date(device_id, date, limit=20, page=1, start_key=None):
-        # Tính số lượng mục cần bỏ qua
-        start_from = (page - 1) * limit
-
+    def get_history_by_date(device_id, date, limit=20, start_key=None):
         start_date = f"{date}T00:00:00"
         end_date = f"{date}T23:59:59"
 
-        if page > 1 and not start_key:
-            response = history_table.query(
-                KeyConditionExpression=Key('id').eq(device_id) & Key('created_at').between(start_date, end_date),
-                ScanIndexForward=False,  
-                Limit=start_from + limit  
-            )
-            
-            # Nếu không có đủ dữ liệu để lấy số lượng cần thiết
-            if not response['Items']:
-                return [], None
-            
-            # Lấy LastEvaluatedKey từ kết quả, nếu có
-            start_key = response.get('LastEvaluatedKey', None)
-            
-            if start_key is None and len(response['Items']) < start_from + limit:
-                # Nếu không có LastEvaluatedKey và số lượng mục ít hơn start_from + limit, nghĩa là không đủ dữ liệu
-                return [], None
-
-        # Bước 2: Truy vấn từ phần tử thứ (start_from) trở đi
         query_params = {
             'KeyConditionExpression': Key('id').eq(device_id) & Key('created_at').between(start_date, end_date),
             'ScanIndexForward': False,  # Sắp xếp giảm dần theo created_at
@@ -133,24 +113,88 @@ class HistoryRepository:
         return items, last_evaluated_key
     
     @staticmethod
-    def get_histories_by_date(date):
-        histories = history_table.query(
-            IndexName='created_date-created_at-index', 
-            KeyConditionExpression=Key('created_date').eq(date)
+    def get_histories_by_date(date, page_size=QUERY_PAGE_SIZE, prefetch=QUERY_PREFETCH):
+        """
+        Every history row of `date` in check-in order, as a generator that
+        reads the index page by page. Consume it lazily, a busy day does not
+        fit in one query response nor should it sit in memory.
+        """
+        return paginate(
+            history_table.query,
+            {
+                'IndexName': 'created_date-created_at-index',
+                'KeyConditionExpression': Key('created_date').eq(date)
+            },
+            page_size=page_size,
+            prefetch=prefetch
         )
-        return histories.get('Items', [])
     
+    @staticmethod
+    def get_daily_attendance(date):
+        """
+        First check-in of each employee on `date`, with the last event and
+        the event count when the roll-up has the date complete. Other days
+        are deduplicated from the raw history.
+        """
+        if AttendanceDailyRepository.is_enabled() and AttendanceDailyRepository.is_complete(date):
+            return AttendanceDailyRepository.get_by_date(date)
+
+        seen_ids = set()
+        return (
+            history for history in HistoryRepository.get_histories_by_date(date)
+            if history['id'] not in seen_ids and not seen_ids.add(history['id'])
+        )
+
     @staticmethod
     def get_histories_detail(user_id, date_query):
-        histories = history_table.scan(
-            FilterExpression="employee_information.id = :eid AND created_date = :cdate",
-            ExpressionAttributeValues={
-                ":eid": user_id,
-                ":cdate": date_query
-            }
+        return list(HistoryRepository.get_histories_of_employee(user_id, date_query, date_query))
+
+    @staticmethod
+    def get_histories_of_employee(user_id, start_date, end_date, page_size=QUERY_PAGE_SIZE):
+        """
+        History rows of one employee from `start_date` to `end_date` included,
+        in check-in order. Rows are keyed by (user id, created_at), this is a
+        range query on the table whatever its size.
+        """
+        return paginate(
+            history_table.query,
+            {
+                'KeyConditionExpression': (
+                    Key('id').eq(user_id) & Key('created_at').between(f"{start_date}T00:00:00", f"{end_date}T23:59:59")
+                )
+            },
+            page_size=page_size
         )
-        return histories.get('Items', [])
     
+    @staticmethod
+    def find_referenced_images():
+        """
+        Image keys snapshotted into check-in records, read in one paginated
+        scan. They must outlive the user reference they were copied from.
+        """
+        image_keys = set()
+        scan_params = {
+            'ProjectionExpression': 'employee_information.image'
+        }
+        while True:
+            response = history_table.scan(**scan_params)
+            for item in response["Items"]:
+                image_key = item.get("employee_information", {}).get("image")
+                if image_key:
+                    image_keys.add(image_key)
+            if "LastEvaluatedKey" not in response:
+                return image_keys
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @staticmethod
+    def get_timesheet(user_id, start_date, end_date):
+        """
+        One attendance entry per day the employee checked in, shaped like the
+        daily roll-up items: first check-in, last event and event count.
+        """
+        summaries = summarize(HistoryRepository.get_histories_of_employee(user_id, start_date, end_date))
+        return [build_attendance(*summaries[key]) for key in sorted(summaries)]
+
     @staticmethod
     def get_latest_record(user_id, created_at):
         start_date = f"{created_at}T00:00:00"
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Items read per query page of a paginated read
+QUERY_PAGE_SIZE = int(os.environ.get('DYNAMODB_QUERY_PAGE_SIZE', 500))
+# Fetch the next page while the caller is still consuming the current one
+QUERY_PREFETCH = os.environ.get('DYNAMODB_QUERY_PREFETCH', 'true').lower() == 'true'
+
+prefetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('DYNAMODB_QUERY_PREFETCH_WORKERS', 4)),
+    thread_name_prefix="query-prefetch"
+)
+
+
+def paginate(query, params, page_size=QUERY_PAGE_SIZE, prefetch=QUERY_PREFETCH):
+    """
+    Yield the items of `query(**params)` (a table `query` or `scan`) page by
+    page, following LastEvaluatedKey until the end.
+
+    Nothing is read before the first item is requested and at most two pages
+    are held at once, the one being consumed and, with `prefetch`, the next.
+    Closing the generator early stops the reads.
+    """
+    params = {**params, 'Limit': page_size}
+    response = query(**params)
+    next_page = None
+    try:
+        while True:
+            last_evaluated_key = response.get('LastEvaluatedKey')
+            if last_evaluated_key and prefetch:
+                next_page = prefetch_executor.submit(query, **params, ExclusiveStartKey=last_evaluated_key)
+
+            yield from response['Items']
+
+            if not last_evaluated_key:
+                return
+            if next_page:
+                response, next_page = next_page.result(), None
+            else:
+                response = query(**params, ExclusiveStartKey=last_evaluated_key)
+    finally:
+        if next_page:
+            next_page.cancel()
@@ -0,0 +1,38 @@
+import boto3
+import os
+import time
+
+dynamodb_client = boto3.resource('dynamodb', os.environ.get('AWS_REGION'))
+# DynamoDB table name, keyed by id. Without it the progress of a background
+# RFID upload can only be polled from the process that accepted it
+rfid_upload_job_table_name = os.environ.get('AWS_DYNAMODB_TABLE_RFID_UPLOAD_JOB')
+rfid_upload_job_table = dynamodb_client.Table(rfid_upload_job_table_name) if rfid_upload_job_table_name else None
+
+# Jobs are kept for a day, `expires_at` is the table TTL attribute
+RFID_UPLOAD_JOB_TTL = int(os.environ.get('RFID_UPLOAD_JOB_TTL', 24 * 60 * 60))  # in seconds
+
+COUNTER_FIELDS = ['total', 'resolved', 'found', 'written']
+
+
+class RfidUploadJobRepository:
+    @staticmethod
+    def is_enabled():
+        return rfid_upload_job_table is not None
+
+    @staticmethod
+    def save(job):
+        """
+        Write the whole job, it is only updated by the worker running it.
+        """
+        rfid_upload_job_table.put_item(Item={**job, 'expires_at': int(time.time()) + RFID_UPLOAD_JOB_TTL})
+
+    @staticmethod
+    def find_by_id(job_id):
+        response = rfid_upload_job_table.get_item(Key={'id': job_id})
+        item = response.get('Item')
+        if not item or item['expires_at'] < time.time():
+            # TTL deletion runs late, an expired job is already gone
+            return None
+        item.pop('expires_at')
+        # Numbers come back as Decimal
+        return {**item, **{field: int(item[field]) for field in COUNTER_FIELDS}}
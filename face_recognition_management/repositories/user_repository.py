@@ -1,21 +1,232 @@
 import boto3
+import copy
+import hashlib
+import json
 import os
-from ..constants import UserAccountStatus
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import ClientError
+from ..constants import UserAccountStatus, Role
+from ..ultils.cache import TTLCache
 
 dynamodb_client = boto3.resource('dynamodb', os.environ.get('AWS_REGION'))
 
 user_table_name = os.environ.get('AWS_DYNAMODB_TABLE_NAME')
 user_table = dynamodb_client.Table(user_table_name)
 
+# Global secondary indexes of the user table, created by `manage.py ensure_user_indexes`
+USER_INDEXES = {
+    'username': 'username-index',
+    'rfid_id': 'rfid_id-index',
+    'device_id': 'device_id-index',
+}
+INDEX_STATUS_TTL = 60  # in seconds
+RFID_LOOKUP_WORKERS = 8
+index_status = {
+    "checked_at": 0,
+    "active": set()
+}
+
+def get_active_indexes():
+    """
+    Names of the user table indexes that can serve queries. An index that is
+    still being created or backfilled is left out until it is complete.
+    """
+    if time.time() - index_status["checked_at"] < INDEX_STATUS_TTL:
+        return index_status["active"]
+
+    try:
+        table = user_table.meta.client.describe_table(TableName=user_table_name)["Table"]
+        index_status["active"] = {
+            index["IndexName"] for index in table.get("GlobalSecondaryIndexes", [])
+            if index["IndexStatus"] == "ACTIVE" and not index.get("Backfilling")
+        }
+    except ClientError as e:
+        print(f"Can't describe table {user_table_name}: {e}")
+    index_status["checked_at"] = time.time()
+    return index_status["active"]
+
+# Identity lookups for badge swipes and face matches, keyed by (attribute, value)
+IDENTITY_KEYS = ['id', 'rfid_id', 'username']
+user_cache = TTLCache(
+    name="users",
+    max_size=int(os.environ.get('USER_CACHE_MAX_SIZE', 10000)),
+    ttl=int(os.environ.get('USER_CACHE_TTL', 30)),
+    stale_ttl=int(os.environ.get('USER_CACHE_STALE_TTL', 300))
+)
+
+def cached_user_lookup(attribute, value, loader):
+    def load():
+        user = loader()
+        # Whichever key found the user, the other identity lookups can use it too
+        if user:
+            for key in IDENTITY_KEYS:
+                if key != attribute and user.get(key):
+                    user_cache.set((key, user[key]), user)
+        return user
+
+    user = user_cache.get((attribute, value), load)
+    # Views update the returned record in place, never hand out the cached one
+    return copy.deepcopy(user) if user else None
+
+# Employees of a device as shown on the dashboard, keyed by device id
+roster_cache = TTLCache(
+    name="rosters",
+    max_size=int(os.environ.get('ROSTER_CACHE_MAX_SIZE', 1000)),
+    ttl=int(os.environ.get('ROSTER_CACHE_TTL', 30)),
+    stale_ttl=int(os.environ.get('ROSTER_CACHE_STALE_TTL', 300))
+)
+
+def invalidate_cached_user(user):
+    keys = {(key, user[key]) for key in IDENTITY_KEYS if user.get(key)}
+    device_ids = {user.get("device_id")}
+    # The record before this write may hold a different RFID or username
+    cached_user = user_cache.peek(('id', user.get("id")))
+    if cached_user:
+        keys.update((key, cached_user[key]) for key in IDENTITY_KEYS if cached_user.get(key))
+        device_ids.add(cached_user.get("device_id"))
+    for key in keys:
+        user_cache.invalidate(key)
+    # Any user write changes the roster version of its device
+    for device_id in device_ids - {None}:
+        roster_cache.invalidate(device_id)
+
+# Guard items reserve a unique value, they share the user table under a prefixed id
+# and hold none of the indexed attributes so they never show up in user lookups
+GUARD_PREFIXES = {
+    'username': 'USERNAME#',
+    'rfid': 'RFID#',
+    'master_account': 'MASTER#',
+}
+
+# Reference counts of the content-addressed images, also kept in the user table
+IMAGE_REFERENCE_PREFIX = 'IMAGE#'
+
+class DuplicateUserError(ValueError):
+    def __init__(self, field, value):
+        super().__init__(f"{field} {value} is already taken")
+        self.field = field
+        self.value = value
+
+class ImageDeletingError(Exception):
+    """The garbage collector is deleting the image, its reference can't be taken now."""
+    def __init__(self, image_key, deleting_at):
+        super().__init__(f"Image {image_key} is being deleted")
+        self.image_key = image_key
+        self.deleting_at = deleting_at
+
+def build_guards(user_data):
+    """
+    Unique values claimed by a user record: its username, its badge (stored as
+    `rfid_id` for employees and `rfid` for hosts) and, for a host, its device.
+    """
+    guards = {
+        'username': user_data.get("username"),
+        'rfid': user_data.get("rfid_id") or user_data.get("rfid"),
+    }
+    if user_data.get("role") == Role.HOST.value:
+        guards['master_account'] = user_data.get("device_id")
+    return {field: value for field, value in guards.items() if value}
+
+def without_empty_index_keys(user):
+    """
+    Copy of `user` without the indexed attributes that are None or empty, a
+    GSI key must be a non-empty string and DynamoDB rejects the whole write
+    otherwise. An employee without RFID is simply left out of rfid_id-index.
+    """
+    return {
+        key: value for key, value in user.items()
+        if key not in USER_INDEXES or (value is not None and value != '')
+    }
+
+def build_guard_item(field, value, user_id):
+    return {
+        'id': f"{GUARD_PREFIXES[field]}{value}",
+        'user_id': user_id,
+        'guard': field,
+    }
+
 class UserRepository:
     @staticmethod
     def create_user(user_data):
-        user_table.put_item(
-            Item= user_data
-        )
+        """
+        Write a user together with the guard items of its unique values in one
+        transaction, so two concurrent registrations can't both succeed.
+
+        Raises:
+            DuplicateUserError: A guard (or the user id itself) already exists.
+        """
+        guards = list(build_guards(user_data).items())
+        items = [without_empty_index_keys(user_data)] + [build_guard_item(field, value, user_data["id"]) for field, value in guards]
+
+        try:
+            user_table.meta.client.transact_write_items(TransactItems=[
+                {
+                    'Put': {
+                        'TableName': user_table_name,
+                        'Item': item,
+                        'ConditionExpression': 'attribute_not_exists(id)'
+                    }
+                }
+                for item in items
+            ])
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            # Reasons are listed in the order of the items, the first one is the user
+            reasons = e.response.get("CancellationReasons", [])
+            for position, reason in enumerate(reasons):
+                if reason.get("Code") == "ConditionalCheckFailed":
+                    if position == 0:
+                        raise DuplicateUserError('id', user_data["id"])
+                    raise DuplicateUserError(*guards[position - 1])
+            raise
+
+        invalidate_cached_user(user_data)
 
     @staticmethod
-    def find_by_id(user_id):
+    def create_guard(field, value, user_id):
+        """
+        Returns:
+            bool: False when the value is already claimed.
+        """
+        try:
+            user_table.put_item(
+                Item=build_guard_item(field, value, user_id),
+                ConditionExpression='attribute_not_exists(id)'
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    @staticmethod
+    def find_identity_keys():
+        """
+        Every username and RFID already taken, read in one paginated scan.
+        """
+        usernames = set()
+        rfid_ids = set()
+        scan_params = {
+            'ProjectionExpression': 'username, rfid_id, rfid'
+        }
+        while True:
+            response = user_table.scan(**scan_params)
+            for item in response["Items"]:
+                if item.get("username"):
+                    usernames.add(item["username"])
+                # Host accounts store their badge under `rfid`
+                for key in ("rfid_id", "rfid"):
+                    if item.get(key):
+                        rfid_ids.add(item[key])
+
+            if "LastEvaluatedKey" not in response:
+                return usernames, rfid_ids
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @staticmethod
+    def query_by_id(user_id):
         find_user_response = user_table.query(
             KeyConditionExpression = boto3.dynamodb.conditions.Key('id').eq(user_id)
         )
@@ -24,50 +235,125 @@ class UserRepository:
                 
         return find_user_response["Items"][0];
 
+    @staticmethod
+    def find_by_id(user_id):
+        return cached_user_lookup('id', user_id, lambda: UserRepository.query_by_id(user_id))
+
     @staticmethod
     def find_active_user_by_id(user_id):
-        find_user_response = user_table.query(
-            KeyConditionExpression = boto3.dynamodb.conditions.Key('id').eq(user_id)
-        )
-        if not find_user_response["Items"] or find_user_response["Items"][0]["status"] != UserAccountStatus.ACTIVE.value:
+        found_user = UserRepository.find_by_id(user_id)
+        if not found_user or found_user["status"] != UserAccountStatus.ACTIVE.value:
             return None
                 
-        return find_user_response["Items"][0];
+        return found_user
+
+    @staticmethod
+    def find_by_attribute(attribute, value, limit=None):
+        """
+        Users whose `attribute` equals `value`, read from the attribute's
+        secondary index. Falls back to a paginated scan while the index is
+        missing or backfilling.
+        """
+        index_name = USER_INDEXES[attribute]
+        # Items without the attribute (or with a null value) are not in the index
+        if value is not None and index_name in get_active_indexes():
+            params = {
+                'IndexName': index_name,
+                'KeyConditionExpression': boto3.dynamodb.conditions.Key(attribute).eq(value)
+            }
+            read_page = user_table.query
+        else:
+            params = {
+                'FilterExpression': boto3.dynamodb.conditions.Attr(attribute).eq(value)
+            }
+            read_page = user_table.scan
+
+        items = []
+        while True:
+            response = read_page(**params)
+            items.extend(response["Items"])
+            if "LastEvaluatedKey" not in response or (limit and len(items) >= limit):
+                return items[:limit] if limit else items
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
 
     @staticmethod
     def find_by_username(username):
-        found_account = user_table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('username').eq(username)
-        )
-        if not found_account["Items"]:
-            return None
-        return found_account["Items"][0]
+        def load():
+            found_accounts = UserRepository.find_by_attribute('username', username, limit=1)
+            return found_accounts[0] if found_accounts else None
+
+        return cached_user_lookup('username', username, load)
     
     @staticmethod
     def find_by_rfid_id(rfid_id):
-        found_account = user_table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('rfid_id').eq(rfid_id)
-        )
-        if not found_account["Items"]:
-            return None
-        return found_account["Items"][0]
-        
+        def load():
+            found_accounts = UserRepository.find_by_attribute('rfid_id', rfid_id, limit=1)
+            return found_accounts[0] if found_accounts else None
+
+        return cached_user_lookup('rfid_id', rfid_id, load)
+
+
+    @staticmethod
+    def find_by_rfid_ids(rfid_ids, on_progress=None):
+        """
+        Resolve many badges at once, from the identity cache or the RFID index
+        in parallel.
+
+        Returns:
+            dict: RFID -> user, unknown badges are left out.
+        """
+        found_accounts = {}
+        with ThreadPoolExecutor(max_workers=RFID_LOOKUP_WORKERS) as executor:
+            futures = {executor.submit(UserRepository.find_by_rfid_id, rfid_id): rfid_id for rfid_id in rfid_ids}
+            for future in as_completed(futures):
+                found_account = future.result()
+                if found_account:
+                    found_accounts[futures[future]] = found_account
+                if on_progress:
+                    on_progress()
+        return found_accounts
 
     @staticmethod
     def find_exist_device_with_device_id(device_id):
-        found_device = user_table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('device_id').eq(device_id)
-        )
-        if not found_device["Items"]:
+        found_devices = UserRepository.find_by_attribute('device_id', device_id, limit=1)
+        if not found_devices:
             return None
-        return found_device["Items"][0]
+        return found_devices[0]
     
     @staticmethod
     def find_users_device(device_id):
-        found_users_device = user_table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('device_id').eq(device_id)
-        )
-        return found_users_device["Items"];
+        return UserRepository.find_by_attribute('device_id', device_id)
+
+    @staticmethod
+    def find_device_roster(device_id):
+        """
+        Active employees of a device without their password, with a version
+        stamp that changes whenever the roster does.
+
+        Returns:
+            dict | None: `version` and `employees`, None when the device has
+            no users at all.
+        """
+        def load():
+            device_users = UserRepository.find_users_device(device_id)
+            if not device_users:
+                return None
+
+            employees = []
+            for device_user in device_users:
+                if device_user["role"] != Role.ADMIN.value and device_user["status"] != UserAccountStatus.DELETED.value:
+                    device_user.pop("password", None)
+                    employees.append(device_user)
+
+            # A content hash gives every worker process the same version for the same roster
+            content = json.dumps(employees, sort_keys=True, default=str)
+            return {
+                "version": hashlib.sha1(content.encode('utf-8')).hexdigest(),
+                "employees": employees
+            }
+
+        roster = roster_cache.get(device_id, load)
+        return copy.deepcopy(roster) if roster else None
 
     @staticmethod
     def update_user_status(user):
@@ -84,6 +370,7 @@ class UserRepository:
             },
             ReturnValues='UPDATED_NEW'  # Trả về các thuộc tính đã cập nhật
         )
+        invalidate_cached_user(user)
 
         return response
     
@@ -92,9 +379,224 @@ class UserRepository:
         with user_table.batch_writer() as batch:
             for user in users:
                 user["status"] = UserAccountStatus.DELETED.value
-                batch.put_item(Item=user)
+                batch.put_item(Item=without_empty_index_keys(user))
+        for user in users:
+            invalidate_cached_user(user)
+
+    @staticmethod
+    def update_image_variants(user_id, image_key, image_variants):
+        """
+        Record the derived images of a user, unless its image changed since
+        they were generated.
+
+        Returns:
+            bool: False when the user no longer has `image_key`.
+        """
+        try:
+            response = user_table.update_item(
+                Key={'id': user_id},
+                UpdateExpression='SET image_variants = :image_variants',
+                ConditionExpression='image = :image',
+                ExpressionAttributeValues={
+                    ':image_variants': image_variants,
+                    ':image': image_key
+                },
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+
+        invalidate_cached_user(response["Attributes"])
+        return True
+
+    @staticmethod
+    def add_image_reference(image_key, delta):
+        """
+        Move the reference count of a stored image, kept in the user table
+        under `IMAGE#<key>`.
+
+        Returns:
+            int | None: The count before the update, None when the image had
+            no reference item.
+
+        Raises:
+            ImageDeletingError: A reference is taken on an image the collector
+            marked for deletion, the caller waits for the item to be gone.
+        """
+        update_params = {
+            'Key': {'id': f"{IMAGE_REFERENCE_PREFIX}{image_key}"},
+            'UpdateExpression': 'ADD ref_count :delta SET object_key = :object_key, updated_at = :updated_at',
+            'ExpressionAttributeValues': {
+                ':delta': delta,
+                ':object_key': image_key,
+                ':updated_at': int(time.time())
+            },
+            'ReturnValues': 'UPDATED_OLD'
+        }
+        if delta > 0:
+            update_params['ConditionExpression'] = 'attribute_not_exists(deleting_at)'
+            update_params['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+        try:
+            response = user_table.update_item(**update_params)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            deleting_at = e.response.get("Item", {}).get("deleting_at", {}).get("N")
+            raise ImageDeletingError(image_key, int(deleting_at) if deleting_at else int(time.time()))
+        ref_count = response.get("Attributes", {}).get("ref_count")
+        return int(ref_count) if ref_count is not None else None
+
+    @staticmethod
+    def find_unreferenced_images(released_before):
+        """
+        Keys of the images nobody references since before `released_before`
+        (epoch seconds), read in one paginated scan.
+        """
+        image_keys = []
+        scan_params = {
+            'FilterExpression': (
+                boto3.dynamodb.conditions.Attr('id').begins_with(IMAGE_REFERENCE_PREFIX)
+                & boto3.dynamodb.conditions.Attr('ref_count').lte(0)
+                & boto3.dynamodb.conditions.Attr('updated_at').lt(int(released_before))
+            ),
+            'ProjectionExpression': 'object_key'
+        }
+        while True:
+            response = user_table.scan(**scan_params)
+            image_keys.extend(item["object_key"] for item in response["Items"])
+            if "LastEvaluatedKey" not in response:
+                return image_keys
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    @staticmethod
+    def mark_image_deleting(image_key, deleting_at, stale_before):
+        """
+        Tombstone an unreferenced image before its object is deleted, new
+        references wait until the tombstone is gone. A tombstone older than
+        `stale_before` was left by a collector that died and is taken over.
+
+        Returns:
+            bool: False when the image was referenced again in the meantime.
+        """
+        try:
+            user_table.update_item(
+                Key={'id': f"{IMAGE_REFERENCE_PREFIX}{image_key}"},
+                UpdateExpression='SET deleting_at = :deleting_at',
+                ConditionExpression='ref_count <= :zero AND (attribute_not_exists(deleting_at) OR deleting_at < :stale_before)',
+                ExpressionAttributeValues={
+                    ':zero': 0,
+                    ':deleting_at': int(deleting_at),
+                    ':stale_before': int(stale_before)
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    @staticmethod
+    def clear_image_tombstone(image_key, deleting_at):
+        """
+        Take over the stale tombstone `deleting_at`, the image can be
+        referenced (and uploaded) again.
+
+        Returns:
+            bool: False when another caller or the collector got there first.
+        """
+        try:
+            user_table.update_item(
+                Key={'id': f"{IMAGE_REFERENCE_PREFIX}{image_key}"},
+                UpdateExpression='REMOVE deleting_at',
+                ConditionExpression='deleting_at = :deleting_at',
+                ExpressionAttributeValues={':deleting_at': int(deleting_at)}
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    @staticmethod
+    def delete_image_reference(image_key, deleting_at):
+        """
+        Remove the reference item once its object is deleted, if it still
+        carries the tombstone `deleting_at`.
+
+        Returns:
+            bool: False when the tombstone was taken over in the meantime.
+        """
+        try:
+            user_table.delete_item(
+                Key={'id': f"{IMAGE_REFERENCE_PREFIX}{image_key}"},
+                ConditionExpression='deleting_at = :deleting_at',
+                ExpressionAttributeValues={':deleting_at': int(deleting_at)}
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    @staticmethod
+    def update_attributes(user_id, attributes, expected=None, remove=None):
+        """
+        Set only `attributes` of an active user, as long as the stored values
+        of `expected` are unchanged. Unlike `save`, a concurrent change of any
+        other attribute (password, status, image) is never written over.
+
+        Returns:
+            dict | None: The updated user, None if it is no longer active or
+            one of the `expected` values changed.
+        """
+        names = {'#status': 'status'}
+        values = {':active': UserAccountStatus.ACTIVE.value}
+        set_expressions = []
+        conditions = ['#status = :active']
+        # Clearing an indexed attribute removes it, it can't be stored empty
+        remove = list(remove or []) + [
+            attribute for attribute, value in attributes.items()
+            if attribute in USER_INDEXES and (value is None or value == '')
+        ]
+        attributes = without_empty_index_keys(attributes)
+        for index, (attribute, value) in enumerate(attributes.items()):
+            names[f'#set{index}'] = attribute
+            values[f':set{index}'] = value
+            set_expressions.append(f'#set{index} = :set{index}')
+        for index, (attribute, value) in enumerate((expected or {}).items()):
+            names[f'#expected{index}'] = attribute
+            if value is None:
+                conditions.append(f'attribute_not_exists(#expected{index})')
+                continue
+            values[f':expected{index}'] = value
+            conditions.append(f'#expected{index} = :expected{index}')
+        update_expression = 'SET ' + ', '.join(set_expressions) if set_expressions else ''
+        if remove:
+            for index, attribute in enumerate(remove):
+                names[f'#remove{index}'] = attribute
+            update_expression += ' REMOVE ' + ', '.join(f'#remove{index}' for index in range(len(remove)))
+
+        try:
+            response = user_table.update_item(
+                Key={'id': user_id},
+                UpdateExpression=update_expression.strip(),
+                ConditionExpression=' AND '.join(conditions),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return None
+            raise
+
+        invalidate_cached_user(response["Attributes"])
+        return response["Attributes"]
 
     @staticmethod
     def save(user):
-        response = user_table.put_item(Item=user)
+        response = user_table.put_item(Item=without_empty_index_keys(user))
+        invalidate_cached_user(user)
         return response
\ No newline at end of file
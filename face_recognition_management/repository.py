@@ -1,4 +1,7 @@
 from .repositories.device_repository import DeviceRepository
 from .repositories.history_repository import HistoryRepository
 from .repositories.user_repository import UserRepository
-from .repositories.history_action_repository import HistoryActionRepository
\ No newline at end of file
+from .repositories.history_action_repository import HistoryActionRepository
+from .repositories.black_list_repository import BlackListRepository
+from .repositories.attendance_daily_repository import AttendanceDailyRepository
+from .repositories.rfid_upload_job_repository import RfidUploadJobRepository
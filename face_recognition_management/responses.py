@@ -1,3 +1,6 @@
+import json
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -29,6 +32,10 @@ class ResponseOk(Response):
             'data': data
         }
     
+class ResponseNotModified(Response):
+    def __init__(self, status_code=status.HTTP_304_NOT_MODIFIED, headers=None, **kwargs):
+        super().__init__(status=status_code, headers=headers, **kwargs)
+    
 class ResponseNotFound(Response):
     def __init__(self, message='Not found', status_code=status.HTTP_404_NOT_FOUND, headers=None, **kwargs):
         formatted_data = self.format_data(message, status_code)
@@ -88,3 +95,67 @@ class ResponseInternalServerError(Response):
             'message': message,
             "data": {}
         }
+
+class ResponseConflict(Response):
+    def __init__(self, message='The resource was changed in the meantime, try again', status_code=status.HTTP_409_CONFLICT, headers=None, **kwargs):
+        formatted_data = self.format_data(message, status_code)
+        super().__init__(data=formatted_data, status=status_code, headers=headers, **kwargs)
+
+    def format_data(self, message, status_code):
+        return {
+            'code': status_code,
+            'message': message,
+            "data": {}
+        }
+
+class ResponseServiceUnavailable(Response):
+    def __init__(self, message='Service Unavailable', status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers=None, retry_after=None, **kwargs):
+        formatted_data = self.format_data(message, status_code)
+        if retry_after is not None:
+            headers = {**(headers or {}), 'Retry-After': str(retry_after)}
+        super().__init__(data=formatted_data, status=status_code, headers=headers, **kwargs)
+
+    def format_data(self, message, status_code):
+        return {
+            'code': status_code,
+            'message': message,
+            "data": {}
+        }
+
+class ResponseJson(JsonResponse):
+    """
+    Same body as the responses above for plain (async) Django views, which
+    can't return DRF responses. Callbacks in `on_close` run after the
+    response has been sent to the client.
+    """
+    def __init__(self, data=None, message='ok', status_code=status.HTTP_200_OK, **kwargs):
+        if data is None:
+            data = {}
+        formatted_data = {
+            'code': status_code,
+            'message': message,
+            'data': data
+        }
+        super().__init__(data=formatted_data, status=status_code, **kwargs)
+        self.on_close = []
+
+    def close(self):
+        super().close()
+        for callback in self.on_close:
+            callback()
+
+class ResponseStreamingOk(StreamingHttpResponse):
+    """
+    Same body as ResponseOk for a list `data` given as an iterable, written
+    to the client item by item as it is consumed instead of all at once.
+    """
+    def __init__(self, data, message='ok', status_code=status.HTTP_200_OK, **kwargs):
+        super().__init__(
+            self.stream(data, message, status_code), status=status_code, content_type='application/json', **kwargs
+        )
+
+    def stream(self, data, message, status_code):
+        yield f'{{"code": {status_code}, "message": {json.dumps(message)}, "data": ['
+        for index, item in enumerate(data):
+            yield (',' if index else '') + json.dumps(item, cls=JSONEncoder)
+        yield ']}'
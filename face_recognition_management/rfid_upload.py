@@ -0,0 +1,127 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from .repository import UserRepository, HistoryRepository, RfidUploadJobRepository
+from .constants import AuthenticateMethod
+from .ultils.index import generate_user_information
+
+
+class RfidUploadService:
+    """
+    Ingest the RFID log a device kept while it was offline.
+
+    Badges are deduplicated and resolved in bulk, then one check-in per
+    employee is written in batches. Uploads above ASYNC_THRESHOLD entries
+    run as a background job whose progress can be polled, from any worker
+    when the job table is configured.
+    """
+    ASYNC_THRESHOLD = int(os.environ.get('RFID_UPLOAD_ASYNC_THRESHOLD', 500))
+    MAX_JOBS = 100
+    # Resolved badges between two progress writes to the job table
+    PROGRESS_INTERVAL = int(os.environ.get('RFID_UPLOAD_PROGRESS_INTERVAL', 100))
+
+    # Live state of the jobs accepted by this process, the job table has a copy
+    # updated on every status change and every PROGRESS_INTERVAL badges
+    jobs = OrderedDict()
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rfid-upload")
+
+    @staticmethod
+    def new_job(total):
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": "pending",
+            "total": total,
+            "resolved": 0,
+            "found": 0,
+            "written": 0,
+            "message": ""
+        }
+        with RfidUploadService.lock:
+            RfidUploadService.jobs[job["id"]] = job
+            while len(RfidUploadService.jobs) > RfidUploadService.MAX_JOBS:
+                RfidUploadService.jobs.popitem(last=False)
+        return job
+
+    @staticmethod
+    def save_job(job):
+        if not RfidUploadJobRepository.is_enabled():
+            return
+        try:
+            RfidUploadJobRepository.save(dict(job))
+        except ClientError as e:
+            # Only the progress seen by the other workers lags, the upload carries on
+            print(f"Failed to save RFID upload {job['id']}: {e}")
+
+    @staticmethod
+    def get_job(job_id):
+        with RfidUploadService.lock:
+            job = RfidUploadService.jobs.get(job_id)
+            if job:
+                return dict(job)
+        # Accepted by another worker
+        if RfidUploadJobRepository.is_enabled():
+            return RfidUploadJobRepository.find_by_id(job_id)
+        return None
+
+    @staticmethod
+    def ingest(rfid_ids, job, background=False):
+        # Synchronous uploads are answered directly, only background jobs are polled
+        save_job = RfidUploadService.save_job if background else lambda job: None
+        job["status"] = "running"
+        save_job(job)
+
+        def on_progress():
+            # Called from the lookup threads
+            with RfidUploadService.lock:
+                job["resolved"] += 1
+                if job["resolved"] % RfidUploadService.PROGRESS_INTERVAL == 0:
+                    save_job(job)
+
+        try:
+            found_accounts = UserRepository.find_by_rfid_ids(rfid_ids, on_progress=on_progress)
+            job["found"] = len(found_accounts)
+
+            # One check-in per employee, several badges may map to the same account
+            histories = {}
+            for found_account in found_accounts.values():
+                histories[found_account["id"]] = HistoryRepository.build_history(
+                    user_id=found_account["id"],
+                    user_information=generate_user_information(found_account),
+                    authenticate_with=AuthenticateMethod.RFID.value,
+                    status="Check in"
+                )
+
+            HistoryRepository.create_histories(list(histories.values()))
+            job["written"] = len(histories)
+            job["status"] = "done"
+        except Exception as e:
+            print(f"RFID upload {job['id']} failed: {e}")
+            job["status"] = "failed"
+            job["message"] = str(e)
+        save_job(job)
+        return job
+
+    @staticmethod
+    def upload(entries):
+        """
+        Returns:
+            dict: The finished job, or the pending one for large uploads.
+        """
+        # Keep the first occurrence order, drop repeated swipes of a badge
+        rfid_ids = list(dict.fromkeys(
+            entry.get("rfid") for entry in entries
+            if isinstance(entry, dict) and entry.get("rfid") is not None
+        ))
+
+        job = RfidUploadService.new_job(total=len(rfid_ids))
+        if len(entries) > RfidUploadService.ASYNC_THRESHOLD:
+            # Saved before the response so a poll on another worker finds it
+            RfidUploadService.save_job(job)
+            RfidUploadService.executor.submit(RfidUploadService.ingest, rfid_ids, job, True)
+            return dict(job)
+
+        return dict(RfidUploadService.ingest(rfid_ids, job))
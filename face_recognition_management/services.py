@@ -1,50 +1,108 @@
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 from botocore.exceptions import ClientError
 from datetime import datetime, timedelta, timezone
 from awscrt import io, mqtt
 from awsiot import mqtt_connection_builder
 from awscrt.exceptions import AwsCrtError
+from concurrent.futures import ThreadPoolExecutor
 import jwt
 import sys
 import time
 import os
 import boto3
 import json
+import uuid
+from .ultils.cache import TTLCache
+
+from .storage import storage
 
-# Create S3 client
-s3_client = boto3.client('s3', region_name=os.environ.get('AWS_REGION'))
 s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
+# Presigned URLs keyed by (bucket, key, expiry), handed out again until they
+# are within PRESIGN_SAFETY_MARGIN seconds of expiring
+PRESIGN_SAFETY_MARGIN = int(os.environ.get('PRESIGN_SAFETY_MARGIN', 300))
+presign_cache = TTLCache(
+    name="presigned_urls",
+    max_size=int(os.environ.get('PRESIGN_CACHE_MAX_SIZE', 20000)),
+    ttl=3600,
+    stale_ttl=3600
+)
 # Rekognition
 rekognition_client = boto3.client('rekognition', os.environ.get('AWS_REGION'))
 
 class S3Service:
+    """
+    Image storage, backed by S3 or the local disk depending on STORAGE_BACKEND.
+    """
     @staticmethod
     def put_object(s3_bucket, image_filename, image_data):
-        try:
-            # Upload to S3
-            s3_client.put_object(Bucket=s3_bucket, Key=image_filename, Body=image_data)
-            return True
-        except (NoCredentialsError, PartialCredentialsError) as e:
-            print(f'Credentials error: {e}')
-            return False
-        except Exception as e:
-            print(f'Error uploading file: {e}')
-            return False
+        return storage.put_object(s3_bucket, image_filename, image_data)
+
+    @staticmethod
+    def get_object(s3_bucket, image_filename):
+        return storage.get_object(s3_bucket, image_filename)
+
+    @staticmethod
+    def get_object_head(s3_bucket, image_filename, length):
+        return storage.get_object_head(s3_bucket, image_filename, length)
+
+    @staticmethod
+    def delete_object(s3_bucket, image_filename):
+        return storage.delete_object(s3_bucket, image_filename)
         
     @staticmethod
-    def presigned_url(bucket_name, file_name, expired_in=3600):
+    def presigned_url(bucket_name, file_name, expired_in=3600, min_valid=PRESIGN_SAFETY_MARGIN):
+        """
+        Presigned download URL, reused while it stays valid for at least
+        `min_valid` more seconds so browsers can cache the image.
+        """
+        cache_key = (bucket_name, file_name, expired_in)
+        now = time.time()
+        cached_url = presign_cache.get(cache_key)
+        if cached_url and cached_url[1] - now >= min_valid:
+            return cached_url[0]
+
         # URL for download
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': bucket_name,
-                'Key': file_name,
-                'ResponseContentDisposition': 'inline'
-            },
-            ExpiresIn=expired_in
-        )
+        url = storage.presigned_url(bucket_name, file_name, expired_in)
+        presign_cache.set(cache_key, (url, now + expired_in))
         return url
 
+    @staticmethod
+    def presigned_post(bucket_name, file_name, max_bytes, expired_in=600):
+        """
+        Form fields and URL letting a client upload one image straight to
+        `file_name`, no larger than `max_bytes`.
+        """
+        return storage.presigned_post(bucket_name, file_name, max_bytes, expired_in)
+
+    @staticmethod
+    def object_exists(s3_bucket, image_filename):
+        return storage.object_exists(s3_bucket, image_filename)
+
+    @staticmethod
+    def delete_objects(s3_bucket, image_filenames):
+        """
+        Returns:
+            int: Number of objects deleted, 1000 per request on S3.
+        """
+        return storage.delete_objects(s3_bucket, image_filenames)
+
+    @staticmethod
+    def get_object_size(s3_bucket, image_filename):
+        return storage.get_object_size(s3_bucket, image_filename)
+
+    @staticmethod
+    def presigned_urls(bucket_name, file_names, expired_in=3600, min_valid=PRESIGN_SAFETY_MARGIN):
+        """
+        Presign the images of a list response at once, each distinct key is
+        signed (or read from the cache) a single time.
+
+        Returns:
+            dict: file name -> URL, empty names are left out.
+        """
+        return {
+            file_name: S3Service.presigned_url(bucket_name, file_name, expired_in, min_valid)
+            for file_name in set(file_names) if file_name
+        }
+
 class RekognitionService:
     @staticmethod
     def create_collection(collection_id):
@@ -54,7 +112,25 @@ class RekognitionService:
         except Exception as e:
             print(f"Error: {e}")
             return False
-        
+
+    @staticmethod
+    def delete_collection(collection_id):
+        try:
+            rekognition_client.delete_collection(CollectionId=collection_id)
+            return True
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+
+    @staticmethod
+    def delete_face(collection_id, face_id):
+        try:
+            rekognition_client.delete_faces(CollectionId=collection_id, FaceIds=[face_id])
+            return True
+        except Exception as e:
+            print(f"Error: {e}")
+            return False
+
     @staticmethod
     def authenticate(collection_id, image_data):
         # Search for the face in the Rekognition collection
@@ -78,8 +154,10 @@ class RekognitionService:
             "face_id": None
         }
         try:
+            # S3 objects are read by Rekognition, local ones are sent as bytes
+            stored_image = storage.rekognition_image(s3_bucket_employees, image_filename)
             is_unique_face = rekognition_client.detect_faces(
-                Image={'S3Object': {'Bucket': s3_bucket_employees, 'Name': image_filename}},
+                Image=stored_image,
                 Attributes=['ALL']
             )
 
@@ -89,7 +167,7 @@ class RekognitionService:
 
             found_face = rekognition_client.search_faces_by_image(
                 CollectionId=collection_id,
-                Image={'S3Object': {'Bucket': s3_bucket_employees, 'Name': image_filename}},
+                Image=stored_image,
                 MaxFaces=1
             )
 
@@ -99,7 +177,7 @@ class RekognitionService:
 
             index_response = rekognition_client.index_faces(
                 CollectionId=collection_id,
-                Image={'S3Object': {'Bucket': s3_bucket_employees, 'Name': image_filename}},
+                Image=stored_image,
                 ExternalImageId=username  
             )
 
@@ -117,6 +195,71 @@ class RekognitionService:
             response_message["message"] = "Face indexing failed!"
             return response_message
         
+    @staticmethod
+    def register_face(image_data, image_filename, username, collection_id, upload=True):
+        """
+        Upload and index a new face from the uploaded bytes.
+
+        Detection and the duplicate search run on the in-memory bytes at the
+        same time as the S3 upload, so Rekognition never fetches the object
+        back from S3. The face is only indexed once all three succeeded.
+        With `upload` False the object is already stored and is not written
+        again. Objects are content-addressed and may be shared, releasing the
+        image on failure is left to the caller.
+        """
+        response_message = {
+            "isSuccess": False,
+            "message": "",
+            "face_id": None
+        }
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            if upload:
+                upload_future = executor.submit(S3Service.put_object, s3_bucket_employees, image_filename, image_data)
+            detect_future = executor.submit(
+                rekognition_client.detect_faces,
+                Image={'Bytes': image_data}
+            )
+            search_future = executor.submit(
+                rekognition_client.search_faces_by_image,
+                CollectionId=collection_id,
+                Image={'Bytes': image_data},
+                MaxFaces=1
+            )
+
+        try:
+            if upload and not upload_future.result():
+                response_message["message"] = "Upload failure"
+                return response_message
+
+            if len(detect_future.result()['FaceDetails']) != 1:
+                response_message["message"] = "Too many faces in one picture!"
+                return response_message
+
+            if search_future.result()["FaceMatches"]:
+                response_message["message"] = "Face already exists!"
+                return response_message
+
+            index_response = rekognition_client.index_faces(
+                CollectionId=collection_id,
+                Image={'Bytes': image_data},
+                ExternalImageId=username,
+                MaxFaces=1
+            )
+
+            if index_response['FaceRecords']:
+                response_message["face_id"] = index_response['FaceRecords'][0]['Face']['FaceId']
+                response_message["message"] = "Success!"
+                response_message["isSuccess"] = True
+            else:
+                response_message["message"] = "Face indexing failed!"
+            return response_message
+
+        except ClientError as e:
+            print(f"Error: {e}")
+            response_message["message"] = "Face indexing failed!"
+            return response_message
+
 class AwsIoTService:
     mqtt_connection = None  # Class-level attribute
 
@@ -429,6 +572,8 @@ class TokenService:
             'role': user_data.get('role', 'user'),
             'exp': datetime.now(timezone.utc) + timedelta(minutes=self.access_token_lifetime),
             'iat': datetime.now(timezone.utc),
+            # Unique per token, two tokens issued in the same second must not share a revocation digest
+            'jti': str(uuid.uuid4()),
         }
         return jwt.encode(payload, self.access_token_secret_key, algorithm=self.algorithm)
 
@@ -442,5 +587,7 @@ class TokenService:
             'role': user_data.get('role', 'user'),
             'exp': datetime.now(timezone.utc) + timedelta(minutes=self.access_token_lifetime),
             'iat': datetime.now(timezone.utc),
+            # Unique per token, two tokens issued in the same second must not share a revocation digest
+            'jti': str(uuid.uuid4()),
         }
         return jwt.encode(payload, self.refresh_token_secret_key, algorithm=self.algorithm)
\ No newline at end of file
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import tempfile
+import time
+import boto3
+from abc import ABC, abstractmethod
+from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# "s3" (default) or "local"
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3').lower()
+LOCAL_STORAGE_ROOT = os.environ.get('LOCAL_STORAGE_ROOT', '/var/lib/face-recognition/storage')
+# Prefix of the signed local URLs, e.g. the address of the gateway as seen by the clients
+LOCAL_STORAGE_BASE_URL = os.environ.get('LOCAL_STORAGE_BASE_URL', '').rstrip('/')
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class StorageBackend(ABC):
+    """
+    Object storage used by `S3Service`. Objects live under a bucket and a
+    key, reads return the bytes and signed URLs expire after `expired_in`.
+    """
+    @abstractmethod
+    def put_object(self, bucket, key, data):
+        pass
+
+    @abstractmethod
+    def get_object(self, bucket, key):
+        pass
+
+    @abstractmethod
+    def get_object_head(self, bucket, key, length):
+        """The first `length` bytes of an object, None when it can't be read."""
+
+    @abstractmethod
+    def delete_object(self, bucket, key):
+        pass
+
+    def delete_objects(self, bucket, keys):
+        return sum(1 for key in keys if self.delete_object(bucket, key))
+
+    def object_exists(self, bucket, key):
+        return self.get_object_size(bucket, key) is not None
+
+    @abstractmethod
+    def get_object_size(self, bucket, key):
+        pass
+
+    @abstractmethod
+    def presigned_url(self, bucket, key, expired_in):
+        pass
+
+    @abstractmethod
+    def presigned_post(self, bucket, key, max_bytes, expired_in):
+        pass
+
+    def rekognition_image(self, bucket, key):
+        """The `Image` argument Rekognition reads a stored object from."""
+        return {'Bytes': self.get_object(bucket, key)}
+
+
+class S3StorageBackend(StorageBackend):
+    def __init__(self):
+        self.client = boto3.client('s3', region_name=os.environ.get('AWS_REGION'))
+
+    def put_object(self, bucket, key, data):
+        try:
+            self.client.put_object(Bucket=bucket, Key=key, Body=data)
+            return True
+        except (NoCredentialsError, PartialCredentialsError) as e:
+            print(f'Credentials error: {e}')
+            return False
+        except Exception as e:
+            print(f'Error uploading file: {e}')
+            return False
+
+    def get_object(self, bucket, key):
+        try:
+            response = self.client.get_object(Bucket=bucket, Key=key)
+            return response['Body'].read()
+        except Exception as e:
+            print(f'Error downloading file: {e}')
+            return None
+
+    def get_object_head(self, bucket, key, length):
+        try:
+            response = self.client.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{length - 1}')
+            return response['Body'].read()
+        except Exception as e:
+            print(f'Error downloading file: {e}')
+            return None
+
+    def delete_object(self, bucket, key):
+        try:
+            self.client.delete_object(Bucket=bucket, Key=key)
+            return True
+        except Exception as e:
+            print(f'Error deleting file: {e}')
+            return False
+
+    def delete_objects(self, bucket, keys):
+        deleted = 0
+        for offset in range(0, len(keys), 1000):
+            try:
+                response = self.client.delete_objects(
+                    Bucket=bucket,
+                    Delete={
+                        'Objects': [{'Key': key} for key in keys[offset:offset + 1000]],
+                        'Quiet': True
+                    }
+                )
+                deleted += len(keys[offset:offset + 1000]) - len(response.get('Errors', []))
+            except ClientError as e:
+                print(f'Error deleting files: {e}')
+        return deleted
+
+    def object_exists(self, bucket, key):
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            # Without s3:ListBucket a missing key answers 403 instead of 404, uploading again is harmless
+            if e.response['Error']['Code'] in ('403', 'AccessDenied', '404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def get_object_size(self, bucket, key):
+        try:
+            return self.client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        except ClientError as e:
+            print(f'Error reading file metadata: {e}')
+            return None
+
+    def presigned_url(self, bucket, key, expired_in):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': bucket,
+                'Key': key,
+                'ResponseContentDisposition': 'inline'
+            },
+            ExpiresIn=expired_in
+        )
+
+    def presigned_post(self, bucket, key, max_bytes, expired_in):
+        return self.client.generate_presigned_post(
+            Bucket=bucket,
+            Key=key,
+            Conditions=[
+                ['content-length-range', 1, max_bytes],
+                ['starts-with', '$Content-Type', 'image/']
+            ],
+            ExpiresIn=expired_in
+        )
+
+    def rekognition_image(self, bucket, key):
+        # Rekognition fetches the object itself
+        return {'S3Object': {'Bucket': bucket, 'Name': key}}
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Objects on the local disk under `<root>/<bucket>/<aa>/<bb>/<key>`, where
+    `aa/bb` comes from the hash of the key so no directory grows past a few
+    thousand entries. Writes go to a temporary file that is renamed over the
+    target, readers never see a partial image. URLs are signed with an HMAC
+    of the Django secret and served by `serve_local_object`.
+    """
+    def __init__(self, root=LOCAL_STORAGE_ROOT, base_url=LOCAL_STORAGE_BASE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url
+
+    def path(self, bucket, key):
+        shard = hashlib.sha256(key.encode()).hexdigest()
+        path = os.path.abspath(os.path.join(self.root, bucket, shard[:2], shard[2:4], key))
+        # Keys come from clients in places, they must not leave the bucket
+        if not path.startswith(os.path.join(self.root, bucket, '')):
+            raise ValueError(f"Invalid object key {key}")
+        return path
+
+    def put_object(self, bucket, key, data):
+        try:
+            path = self.path(bucket, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    if isinstance(data, (bytes, bytearray)):
+                        temp_file.write(data)
+                    else:
+                        data.seek(0)
+                        for chunk in iter(lambda: data.read(COPY_CHUNK_SIZE), b''):
+                            temp_file.write(chunk)
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            return True
+        except Exception as e:
+            print(f'Error uploading file: {e}')
+            return False
+
+    def get_object(self, bucket, key):
+        try:
+            with open(self.path(bucket, key), 'rb') as file:
+                return file.read()
+        except Exception as e:
+            print(f'Error downloading file: {e}')
+            return None
+
+    def get_object_head(self, bucket, key, length):
+        try:
+            with open(self.path(bucket, key), 'rb') as file:
+                return file.read(length)
+        except Exception as e:
+            print(f'Error downloading file: {e}')
+            return None
+
+    def delete_object(self, bucket, key):
+        try:
+            os.remove(self.path(bucket, key))
+            return True
+        except FileNotFoundError:
+            # Same as S3, deleting a missing object succeeds
+            return True
+        except Exception as e:
+            print(f'Error deleting file: {e}')
+            return False
+
+    def get_object_size(self, bucket, key):
+        try:
+            return os.path.getsize(self.path(bucket, key))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def signature(*parts):
+        value = ':'.join(str(part) for part in parts)
+        return salted_hmac('local-storage', value, algorithm='sha256').hexdigest()
+
+    @staticmethod
+    def verify(signature, *parts):
+        return constant_time_compare(signature or '', LocalStorageBackend.signature(*parts))
+
+    def presigned_url(self, bucket, key, expired_in):
+        expires = int(time.time()) + expired_in
+        path = reverse('serve_local_object', kwargs={'bucket': bucket, 'key': key})
+        signature = LocalStorageBackend.signature('get', bucket, key, expires)
+        return f"{self.base_url}{path}?expires={expires}&signature={signature}"
+
+    def presigned_post(self, bucket, key, max_bytes, expired_in):
+        expires = int(time.time()) + expired_in
+        return {
+            'url': f"{self.base_url}{reverse('upload_local_object', kwargs={'bucket': bucket})}",
+            'fields': {
+                'key': key,
+                'expires': str(expires),
+                'max_bytes': str(max_bytes),
+                'signature': LocalStorageBackend.signature('post', bucket, key, expires, max_bytes)
+            }
+        }
+
+
+def get_storage_backend(name=STORAGE_BACKEND):
+    if name == 'local':
+        return LocalStorageBackend()
+    if name == 's3':
+        return S3StorageBackend()
+    raise ValueError(f"Unknown storage backend {name}")
+
+
+storage = get_storage_backend()
@@ -1,3 +1,96 @@
-from django.test import TestCase
+import io
+import os
+import tracemalloc
+import numpy as np
+from asgiref.sync import async_to_sync
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase
+from rest_framework.decorators import api_view
+from .responses import ResponseOk
+from .ultils.frame_cache import FrameCache
+from .ultils.uploads import limit_upload, measure_memory, UPLOAD_SPOOL_THRESHOLD
 
-# Create your tests here.
+MAX_FILE_BYTES = 16 * 1024 * 1024
+
+
+@api_view(['POST'])
+@limit_upload(max_file_bytes=MAX_FILE_BYTES)
+def upload_view(request):
+    file = request.FILES['file']
+    return ResponseOk(data={"size": file.size, "spooled": file.file._rolled})
+
+
+@limit_upload(max_file_bytes=MAX_FILE_BYTES)
+async def upload_view_async(request):
+    return ResponseOk(data={"size": request.FILES['file'].size})
+
+
+class LimitUploadTests(SimpleTestCase):
+    def setUp(self):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+
+    def post_file(self, content):
+        return RequestFactory().post('/upload', {
+            'file': SimpleUploadedFile('frame.jpg', content, content_type='image/jpeg')
+        })
+
+    def test_upload_above_spool_threshold_stays_out_of_memory(self):
+        file_size = UPLOAD_SPOOL_THRESHOLD * 8
+        request = self.post_file(os.urandom(file_size))
+
+        with measure_memory('spooled upload') as report:
+            response = upload_view(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"], {"size": file_size, "spooled": True})
+        # The body is streamed to a temp file chunk by chunk, never held whole
+        self.assertLess(report["peak_heap_growth_bytes"], file_size // 4)
+
+    def test_upload_above_limit_is_rejected(self):
+        response = upload_view(self.post_file(b'\0' * (MAX_FILE_BYTES + 1)))
+        self.assertEqual(response.status_code, 413)
+
+    def test_async_view_is_parsed_and_limited(self):
+        response = async_to_sync(upload_view_async)(self.post_file(b'\0' * 1024))
+        self.assertEqual(response.data["data"], {"size": 1024})
+
+        response = async_to_sync(upload_view_async)(self.post_file(b'\0' * (MAX_FILE_BYTES + 1)))
+        self.assertEqual(response.status_code, 413)
+
+
+def smooth_face(seed):
+    # Stand-in for an aligned 112x112 face crop: random shading, upscaled so it has no pixel noise
+    pixels = np.random.default_rng(seed).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+    return np.asarray(Image.fromarray(pixels).resize((112, 112), Image.BICUBIC))
+
+
+def reencode(face, quality):
+    buffer = io.BytesIO()
+    Image.fromarray(face).save(buffer, format='JPEG', quality=quality)
+    return np.asarray(Image.open(io.BytesIO(buffer.getvalue())).convert('RGB'))
+
+
+class FrameCacheTests(SimpleTestCase):
+    def setUp(self):
+        FrameCache.invalidate('device')
+        face = smooth_face(1)
+        FrameCache.set('device', FrameCache.hash_face(face), {"isSuccess": True, "message": "Welcome", "data": {}})
+
+    def test_noisy_reencoded_face_hits(self):
+        noise = np.random.default_rng(2).integers(-6, 7, (112, 112, 3))
+        noisy = np.clip(smooth_face(1).astype(int) + noise, 0, 255).astype(np.uint8)
+        self.assertIsNotNone(FrameCache.get('device', FrameCache.hash_face(reencode(noisy, 70))))
+
+    def test_different_face_misses(self):
+        self.assertIsNone(FrameCache.get('device', FrameCache.hash_face(smooth_face(3))))
+
+    def test_other_device_misses(self):
+        self.assertIsNone(FrameCache.get('other', FrameCache.hash_face(smooth_face(1))))
+
+    def test_failures_and_frames_without_face_are_not_cached(self):
+        face = smooth_face(4)
+        FrameCache.set('device', FrameCache.hash_face(face), {"isSuccess": False, "message": "No match", "data": None})
+        self.assertIsNone(FrameCache.get('device', FrameCache.hash_face(face)))
+        self.assertIsNone(FrameCache.get('device', FrameCache.hash_face(None)))
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+import time
+from .repository import BlackListRepository
+from .services import TokenService
+from .ultils.bloom_filter import BloomFilter
+from .ultils.cache import TTLCache, refresh_executor
+
+REVOCATION_REFRESH_INTERVAL = int(os.environ.get('TOKEN_REVOCATION_REFRESH_INTERVAL', 30))  # in seconds
+
+# Verified access token claims keyed by token digest, an entry is only used
+# until the `exp` it carries
+claims_cache = TTLCache(
+    name="token_claims",
+    max_size=int(os.environ.get('TOKEN_CLAIMS_CACHE_MAX_SIZE', 10000)),
+    ttl=TokenService().access_token_lifetime * 60,
+    stale_ttl=TokenService().access_token_lifetime * 60
+)
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class RevocationList:
+    """
+    In-memory copy of the black list table. The Bloom filter answers the
+    common "not revoked" case, the exact set confirms its positives. The copy
+    is reloaded in the background every REVOCATION_REFRESH_INTERVAL seconds,
+    tokens revoked by this process are added to it right away.
+    """
+    bloom = BloomFilter(capacity=1)
+    revoked = set()
+    # Digests revoked here while a reload was running, the reload may miss them
+    recent = set()
+    loaded_at = 0
+    refreshing = False
+    lock = threading.Lock()
+
+    @staticmethod
+    def refresh():
+        if not BlackListRepository.is_enabled():
+            # Nothing to reload, the revocations of this process stay in memory
+            RevocationList.loaded_at = time.time()
+            return
+
+        try:
+            digests = BlackListRepository.find_revoked_tokens(time.time())
+        except Exception as e:
+            print(f"Failed to load the token black list: {e}")
+            digests = None
+
+        with RevocationList.lock:
+            if digests is not None:
+                digests |= RevocationList.recent
+                bloom = BloomFilter(capacity=len(digests) * 2 + 1024)
+                for digest in digests:
+                    bloom.add(digest)
+                RevocationList.bloom = bloom
+                RevocationList.revoked = digests
+                RevocationList.recent = set()
+            # A failed reload is retried after the interval, not on every request
+            RevocationList.loaded_at = time.time()
+            RevocationList.refreshing = False
+
+    @staticmethod
+    def is_revoked(digest):
+        age = time.time() - RevocationList.loaded_at
+        if RevocationList.loaded_at == 0:
+            RevocationList.refresh()
+        elif age > REVOCATION_REFRESH_INTERVAL:
+            with RevocationList.lock:
+                start_refresh = not RevocationList.refreshing
+                RevocationList.refreshing = True
+            if start_refresh:
+                refresh_executor.submit(RevocationList.refresh)
+
+        return RevocationList.bloom.contains(digest) and digest in RevocationList.revoked
+
+    @staticmethod
+    def revoke(token, user_id, reason, expires_at):
+        digest = token_digest(token)
+        BlackListRepository.create(digest, user_id, reason, expires_at)
+        with RevocationList.lock:
+            RevocationList.bloom.add(digest)
+            RevocationList.revoked.add(digest)
+            RevocationList.recent.add(digest)
+        claims_cache.invalidate(digest)
+
+
+class AccessTokenVerifier:
+    @staticmethod
+    def verify(token):
+        """
+        Verify an access token without a database round trip: the signature is
+        checked once per token, then its claims are served from memory.
+
+        Returns:
+            dict: `isSuccess` and the claims, or the error message, as `payload`.
+        """
+        digest = token_digest(token)
+        payload = claims_cache.get(digest)
+        if payload is None:
+            verify_token_response = TokenService().verify_access_token(token)
+            if not verify_token_response["isSuccess"]:
+                return verify_token_response
+            payload = verify_token_response["payload"]
+            claims_cache.set(digest, payload)
+        elif payload["exp"] <= time.time():
+            return {
+                "payload": "Token expired",
+                "isSuccess": False
+            }
+
+        if RevocationList.is_revoked(digest):
+            return {
+                "payload": "Token revoked",
+                "isSuccess": False
+            }
+
+        return {
+            "payload": payload,
+            "isSuccess": True
+        }
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background refreshes of stale entries, shared by every cache
+refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire.
+
+    An entry is fresh for `ttl` seconds. Until `stale_ttl` seconds it is
+    still served, while a background thread reloads it. After that it is
+    reloaded on the request path. `None` is never cached.
+    """
+    def __init__(self, name, max_size=1024, ttl=30, stale_ttl=300):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        # Bumped by every invalidation, a load that started before one is not stored
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key, loader=None):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                value, fresh_until, stale_until = entry
+                if now < fresh_until:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+
+                if now < stale_until and loader:
+                    self.entries.move_to_end(key)
+                    self.stats["stale_hits"] += 1
+                    if key not in self.refreshing:
+                        self.refreshing.add(key)
+                        refresh_executor.submit(self.refresh, key, loader, self.generation)
+                    return value
+
+            self.stats["misses"] += 1
+            generation = self.generation
+
+        if not loader:
+            return None
+
+        value = loader()
+        self.set(key, value, generation)
+        return value
+
+    def peek(self, key):
+        # Read without touching the LRU order or the counters
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry[0] if entry else None
+
+    def refresh(self, key, loader, generation):
+        try:
+            value = loader()
+            with self.lock:
+                self.stats["refreshes"] += 1
+            if value is None:
+                self.invalidate(key)
+            else:
+                self.set(key, value, generation)
+        except Exception as e:
+            print(f"Failed to refresh {self.name} cache entry {key}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def set(self, key, value, generation=None):
+        if value is None:
+            return
+
+        now = time.monotonic()
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (value, now + self.ttl, now + self.stale_ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+            return {
+                "name": self.name,
+                "size": len(self.entries),
+                "hit_ratio": round((self.stats["hits"] + self.stats["stale_hits"]) / lookups, 4) if lookups else 0.0,
+                **self.stats,
+            }
@@ -0,0 +1,41 @@
+import os
+from django.core import signing
+
+# Largest page a history endpoint reads, every page costs one bounded query
+HISTORY_PAGE_MAX_LIMIT = int(os.environ.get('HISTORY_PAGE_MAX_LIMIT', 100))
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(last_evaluated_key, scope):
+    """
+    Opaque cursor for the page after `last_evaluated_key`, None on the last
+    page. It is signed and bound to `scope`, a client can neither forge a
+    key nor replay the cursor of another device or date.
+    """
+    if not last_evaluated_key:
+        return None
+    return signing.dumps(last_evaluated_key, salt=f"cursor:{scope}", compress=True)
+
+
+def decode_cursor(cursor, scope):
+    """
+    Returns:
+        dict | None: The ExclusiveStartKey to query from, None for the first page.
+    """
+    if not cursor:
+        return None
+    try:
+        return signing.loads(cursor, salt=f"cursor:{scope}")
+    except signing.BadSignature:
+        raise InvalidCursorError("Invalid cursor")
+
+
+def get_page_limit(request, default=20):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, HISTORY_PAGE_MAX_LIMIT))
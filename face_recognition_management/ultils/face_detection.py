@@ -0,0 +1,112 @@
+import io
+import os
+import threading
+from PIL import Image
+
+# Optional CPU inference dependencies, face detection is disabled without them
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Where the five landmarks (eyes, nose tip, mouth corners) of an upright face
+# sit in a 112x112 crop, the layout ArcFace-style embedding models are trained on
+ALIGNED_FACE_SIZE = 112
+ALIGNED_LANDMARKS = [
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+]
+
+
+class FaceDetector:
+    """
+    Finds the largest face of a frame with OpenCV's YuNet detector and warps
+    it onto the aligned 112x112 layout, so the embeddings and frame hashes
+    computed from it depend on the face and not on the background.
+    """
+    MODEL_PATH = os.environ.get('FACE_DETECTOR_MODEL_PATH')
+    SCORE_THRESHOLD = float(os.environ.get('FACE_DETECTOR_SCORE_THRESHOLD', 0.8))
+    # Frames are detected on at most this long edge, landmarks are scaled back
+    MAX_DIMENSION = int(os.environ.get('FACE_DETECTOR_MAX_DIMENSION', 640))
+
+    # cv2.FaceDetectorYN keeps per-call state, one instance per thread
+    local = threading.local()
+
+    @staticmethod
+    def is_enabled():
+        return bool(FaceDetector.MODEL_PATH) and np is not None and cv2 is not None
+
+    @staticmethod
+    def get_detector():
+        detector = getattr(FaceDetector.local, 'detector', None)
+        if detector is None:
+            detector = cv2.FaceDetectorYN.create(
+                FaceDetector.MODEL_PATH, "", (FaceDetector.MAX_DIMENSION, FaceDetector.MAX_DIMENSION),
+                FaceDetector.SCORE_THRESHOLD
+            )
+            FaceDetector.local.detector = detector
+        return detector
+
+    @staticmethod
+    def detect(pixels):
+        """
+        Returns:
+            numpy.ndarray | None: The 5x2 landmarks of the largest face of an
+            RGB `pixels` array, None when there is no face.
+        """
+        height, width = pixels.shape[:2]
+        scale = min(1.0, FaceDetector.MAX_DIMENSION / max(height, width))
+        frame = pixels[:, :, ::-1]  # YuNet takes BGR
+        if scale < 1.0:
+            frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        detector = FaceDetector.get_detector()
+        detector.setInputSize((frame.shape[1], frame.shape[0]))
+        _, faces = detector.detect(np.ascontiguousarray(frame))
+        if faces is None or not len(faces):
+            return None
+
+        # Rows: x, y, w, h, five landmark (x, y) pairs, score
+        face = max(faces, key=lambda row: row[2] * row[3])
+        return face[4:14].reshape(5, 2) / scale
+
+    @staticmethod
+    def align(image_data, size=ALIGNED_FACE_SIZE):
+        """
+        Returns:
+            numpy.ndarray | None: The largest face of the JPEG `image_data`
+            as a `size` x `size` RGB uint8 array, None without a face.
+        """
+        pixels = np.asarray(Image.open(io.BytesIO(image_data)).convert('RGB'))
+        landmarks = FaceDetector.detect(pixels)
+        if landmarks is None:
+            return None
+
+        reference = np.array(ALIGNED_LANDMARKS, dtype=np.float32) * (size / ALIGNED_FACE_SIZE)
+        # Rotation, uniform scale and translation only, the face is not sheared
+        transform, _ = cv2.estimateAffinePartial2D(landmarks.astype(np.float32), reference, method=cv2.LMEDS)
+        if transform is None:
+            return None
+        return cv2.warpAffine(pixels, transform, (size, size), borderMode=cv2.BORDER_REPLICATE)
+
+    @staticmethod
+    def try_align(image_data):
+        """
+        `align` for callers that carry on without a face: None when the
+        detector is disabled or fails.
+        """
+        if not FaceDetector.is_enabled():
+            return None
+        try:
+            return FaceDetector.align(image_data)
+        except Exception as e:
+            print(f"Face detection failed: {e}")
+            return None
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from collections import deque
+from PIL import Image
+
+
+def dhash(face, hash_size=8):
+    """
+    Perceptual difference hash of an aligned face crop (RGB array).
+
+    Nearly identical crops (same person, same pose, small noise or
+    compression differences) produce hashes a few bits apart.
+    """
+    image = Image.fromarray(face).convert('L').resize((hash_size + 1, hash_size))
+    pixels = list(image.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class FrameCache:
+    """
+    Short-lived per-device cache of face authentication results.
+
+    Door cameras send bursts of almost the same frame. The hash is taken on
+    the aligned face crop (FaceDetector), not the whole frame, so the
+    background can't make two people look alike: a face of the same device
+    within MAX_DISTANCE bits of a recent one reuses that frame's result.
+    Without a detector nothing is cached. Only successful authentications
+    are cached, a failure is retried.
+    """
+    TTL = float(os.environ.get('FRAME_CACHE_TTL', 2))  # in seconds
+    MAX_DISTANCE = int(os.environ.get('FRAME_CACHE_MAX_DISTANCE', 4))  # in bits
+    MAX_ENTRIES_PER_DEVICE = 32
+
+    entries = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def hash_face(face):
+        # `face`: aligned crop from FaceDetector.try_align, None without a face
+        if face is None:
+            return None
+        return dhash(face)
+
+    @staticmethod
+    def get(device_id, frame_hash):
+        if frame_hash is None:
+            return None
+
+        now = time.monotonic()
+        with FrameCache.lock:
+            device_entries = FrameCache.entries.get(device_id)
+            if not device_entries:
+                return None
+
+            # Entries are appended in time order, drop the expired head
+            while device_entries and device_entries[0][0] <= now:
+                device_entries.popleft()
+
+            for _, cached_hash, result in reversed(device_entries):
+                if (cached_hash ^ frame_hash).bit_count() <= FrameCache.MAX_DISTANCE:
+                    return result
+        return None
+
+    @staticmethod
+    def set(device_id, frame_hash, result):
+        if frame_hash is None or not result["isSuccess"]:
+            return
+
+        expires_at = time.monotonic() + FrameCache.TTL
+        with FrameCache.lock:
+            device_entries = FrameCache.entries.setdefault(
+                device_id, deque(maxlen=FrameCache.MAX_ENTRIES_PER_DEVICE)
+            )
+            device_entries.append((expires_at, frame_hash, result))
+
+    @staticmethod
+    def invalidate(device_id):
+        with FrameCache.lock:
+            FrameCache.entries.pop(device_id, None)
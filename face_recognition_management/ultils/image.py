@@ -0,0 +1,137 @@
+import io
+import os
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Rekognition needs faces of at least 40x40 px in a 1920x1080 frame, a long
+# edge of 1280 px keeps every face it can detect in a badge/door photo
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', 1280))
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 512 * 1024))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 90))
+IMAGE_MIN_JPEG_QUALITY = 60
+
+# EXIF tag holding the camera rotation
+EXIF_ORIENTATION = 0x0112
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+def encode_jpeg(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def normalize_image(image_data, max_dimension=IMAGE_MAX_DIMENSION, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Validate an uploaded image and turn it into an upright JPEG no larger
+    than what Rekognition needs.
+
+    Args:
+        image_data (bytes | file): Raw uploaded bytes, or the uploaded file
+            itself so it is decoded from its (possibly spooled) stream
+            without reading it into memory first.
+        max_dimension (int): Longest edge of the output in pixels.
+        max_bytes (int): Upper bound of the encoded output.
+
+    Returns:
+        tuple: (jpeg bytes, stats) where stats holds the before/after byte
+        counts and the output size.
+
+    Raises:
+        InvalidImageError: The bytes are not a readable image.
+    """
+    if isinstance(image_data, (bytes, bytearray)):
+        image_file = io.BytesIO(image_data)
+        original_bytes = len(image_data)
+    else:
+        image_file = image_data
+        image_file.seek(0, os.SEEK_END)
+        original_bytes = image_file.tell()
+        image_file.seek(0)
+
+    try:
+        image = Image.open(image_file)
+        original_size = image.size
+        # Let the JPEG decoder downscale while decoding instead of after
+        image.draft('RGB', (max_dimension, max_dimension))
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(f"Invalid image: {e}")
+
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    is_compliant = (
+        image.format == 'JPEG'
+        and orientation == 1
+        and max(original_size) <= max_dimension
+        and original_bytes <= max_bytes
+    )
+
+    if is_compliant:
+        # Already upright, small and JPEG, re-encoding would only lose quality.
+        # It is at most `max_bytes`, the only read of the upload into memory
+        if isinstance(image_data, (bytes, bytearray)):
+            normalized_data = image_data
+        else:
+            image_file.seek(0)
+            normalized_data = image_file.read()
+    else:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        quality = IMAGE_JPEG_QUALITY
+        normalized_data = encode_jpeg(image, quality)
+        while len(normalized_data) > max_bytes:
+            if quality > IMAGE_MIN_JPEG_QUALITY:
+                quality -= 10
+            else:
+                image = image.resize((int(image.width * 0.8), int(image.height * 0.8)), Image.LANCZOS)
+            normalized_data = encode_jpeg(image, quality)
+
+    stats = {
+        "original_bytes": original_bytes,
+        "normalized_bytes": len(normalized_data),
+        "width": image.width,
+        "height": image.height,
+    }
+    return normalized_data, stats
+
+
+def inspect_image_header(header_data, formats=('JPEG', 'PNG')):
+    """
+    Format and size of an image from its first bytes, without decoding the
+    pixels. Rekognition only reads JPEG and PNG.
+
+    Returns:
+        tuple: (format, width, height).
+
+    Raises:
+        InvalidImageError: The header is not one of an image in `formats`.
+    """
+    try:
+        image = Image.open(io.BytesIO(header_data))
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImageError(f"Invalid image: not a {' or '.join(formats)} file")
+    if image.format not in formats:
+        raise InvalidImageError(f"Invalid image: {image.format} is not supported, use {' or '.join(formats)}")
+    return image.format, image.width, image.height
+
+
+def make_thumbnail(image_data, max_dimension, quality=IMAGE_JPEG_QUALITY):
+    """
+    Downscaled upright JPEG copy of an image, for display only.
+
+    Raises:
+        InvalidImageError: The bytes are not a readable image.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        image.draft('RGB', (max_dimension, max_dimension))
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(f"Invalid image: {e}")
+
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return encode_jpeg(image, quality)
@@ -1,25 +1,19 @@
 import random
 import string
-import bcrypt
-from boto3.dynamodb.types import Binary
 from datetime import datetime
 from ..services import S3Service
+from .password_hasher import PasswordHasher
+from ..image_variants import ImageVariantService
 import os
 
 s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
 
 def password_encrypt(password):
-    # Encrypt the password using bcrypt
-    bytes = password.encode('utf-8') 
-    salt = bcrypt.gensalt() 
-    return bcrypt.hashpw(bytes, salt) 
+    # Encrypt the password using bcrypt, on the bounded bcrypt executor
+    return PasswordHasher.hash(password)
 
 def check_password(plain_password, hashed_password):
-    if isinstance(hashed_password, Binary):
-        hashed_password = hashed_password.value
-    if isinstance(hashed_password, str):
-        hashed_password = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
+    return PasswordHasher.check(plain_password, hashed_password)
 
 def random_value(length):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
@@ -53,28 +47,26 @@ def is_valid_date(date_str):
             continue
     return False
 
-# Hàm lấy start_key
-def get_start_key(start_key_str, device_id=None):
-    if start_key_str:
-        return {
-            "id": device_id,
-            "created_at": start_key_str
-        }
-    return None
-
 def generate_user_information(user_device):
-    return {
+    user_information = {
         "id": user_device["id"],
         "name": f"{user_device['first_name']} {user_device['last_name']}",
         "image": user_device["image"],
         "department": user_device["deparment"],
         "employee_id": user_device["employee_id"]
     }
+    if user_device.get("image_variants"):
+        user_information["image_variants"] = user_device["image_variants"]
+    return user_information
+
+def get_image_size(request):
+    # Display size in pixels a list view asks its images for
+    image_size = request.GET.get('imageSize')
+    return int(image_size) if image_size and image_size.isdigit() else None
 
-def get_histories_response(histories):
+def get_histories_response(histories, image_size=None):
     response_data = {
-        "histories": [],
-        "start_key": histories[1]
+        "histories": []
     }
     # Remember these user is occur in history response array 
     memo = set()
@@ -85,13 +77,23 @@ def get_histories_response(histories):
 
         if key not in memo:
             history["quantity"] = history.get("quantity", 0) + 1
-            history["employee_information"]["image"] = S3Service.presigned_url(
-                bucket_name=s3_bucket_employees, 
-                file_name=history["employee_information"]["image"]
-            )
             response_data["histories"].append(history)
             memo.add(key)
 
+    for history in response_data["histories"]:
+        employee_information = history["employee_information"]
+        employee_information["image"] = ImageVariantService.pick(
+            employee_information["image"], employee_information.pop("image_variants", None), image_size
+        )
+
+    # One signature per distinct image, an employee shows up on many rows
+    image_urls = S3Service.presigned_urls(
+        bucket_name=s3_bucket_employees,
+        file_names=[history["employee_information"]["image"] for history in response_data["histories"]]
+    )
+    for history in response_data["histories"]:
+        history["employee_information"]["image"] = image_urls.get(history["employee_information"]["image"])
+
     return response_data;
 
 def get_current_date():
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.types import Binary
+
+# Cost factor of new hashes, pick it with `manage.py calibrate_bcrypt`
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# bcrypt releases the GIL, a few workers are enough to keep every core busy
+# without starving the request threads of other endpoints
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+# Hashes queued or running at once, above that a login fails fast instead of waiting
+BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', 32))
+# Seconds a client is told to wait (Retry-After) when the hasher is saturated
+BCRYPT_RETRY_AFTER = int(os.environ.get('BCRYPT_RETRY_AFTER', 2))
+
+
+class PasswordHasherBusyError(Exception):
+    retry_after = BCRYPT_RETRY_AFTER
+
+
+def to_bytes(hashed_password):
+    if isinstance(hashed_password, Binary):
+        hashed_password = hashed_password.value
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode('utf-8')
+    return hashed_password
+
+
+def get_rounds(hashed_password):
+    # Hashes look like $2b$12$<salt><digest>
+    try:
+        return int(to_bytes(hashed_password).split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated executor of BCRYPT_WORKERS threads, holding at
+    most BCRYPT_MAX_PENDING hashes, and records how long they waited for a
+    worker.
+    """
+    executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+    slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+    lock = threading.Lock()
+    stats = {
+        "completed": 0,
+        "rejected": 0,
+        "pending": 0,
+        "total_queue_ms": 0.0,
+        "max_queue_ms": 0.0,
+        "total_hash_ms": 0.0,
+    }
+
+    @staticmethod
+    def run(func):
+        if not PasswordHasher.slots.acquire(blocking=False):
+            with PasswordHasher.lock:
+                PasswordHasher.stats["rejected"] += 1
+            raise PasswordHasherBusyError("Too many password checks in progress")
+
+        submitted_at = time.monotonic()
+        with PasswordHasher.lock:
+            PasswordHasher.stats["pending"] += 1
+
+        def task():
+            started_at = time.monotonic()
+            try:
+                return func()
+            finally:
+                finished_at = time.monotonic()
+                queue_ms = (started_at - submitted_at) * 1000
+                with PasswordHasher.lock:
+                    stats = PasswordHasher.stats
+                    stats["pending"] -= 1
+                    stats["completed"] += 1
+                    stats["total_queue_ms"] += queue_ms
+                    stats["max_queue_ms"] = max(stats["max_queue_ms"], queue_ms)
+                    stats["total_hash_ms"] += (finished_at - started_at) * 1000
+                PasswordHasher.slots.release()
+
+        return PasswordHasher.executor.submit(task).result()
+
+    @staticmethod
+    def hash(password, rounds=BCRYPT_ROUNDS):
+        return PasswordHasher.run(
+            lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds))
+        )
+
+    @staticmethod
+    def check(plain_password, hashed_password):
+        hashed_password = to_bytes(hashed_password)
+        return PasswordHasher.run(
+            lambda: bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password)
+        )
+
+    @staticmethod
+    def needs_rehash(hashed_password):
+        return get_rounds(hashed_password) != BCRYPT_ROUNDS
+
+    @staticmethod
+    def metrics():
+        with PasswordHasher.lock:
+            stats = dict(PasswordHasher.stats)
+        completed = stats["completed"]
+        return {
+            "name": "bcrypt",
+            "workers": BCRYPT_WORKERS,
+            "max_pending": BCRYPT_MAX_PENDING,
+            "rounds": BCRYPT_ROUNDS,
+            "completed": completed,
+            "rejected": stats["rejected"],
+            "pending": stats["pending"],
+            "avg_queue_ms": round(stats["total_queue_ms"] / completed, 2) if completed else 0.0,
+            "max_queue_ms": round(stats["max_queue_ms"], 2),
+            "avg_hash_ms": round(stats["total_hash_ms"] / completed, 2) if completed else 0.0,
+        }
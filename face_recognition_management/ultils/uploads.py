@@ -0,0 +1,129 @@
+import asyncio
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from rest_framework import status
+from ..responses import ResponseBadRequest, ResponseJson
+
+# Uploads stay in memory up to this size, larger ones are spooled to a temp file
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024))
+UPLOAD_MAX_IMAGE_BYTES = int(os.environ.get('UPLOAD_MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+UPLOAD_MAX_FRAME_BYTES = int(os.environ.get('UPLOAD_MAX_FRAME_BYTES', 5 * 1024 * 1024))
+UPLOAD_MAX_ARCHIVE_BYTES = int(os.environ.get('UPLOAD_MAX_ARCHIVE_BYTES', 200 * 1024 * 1024))
+
+
+class SpooledUploadHandler(FileUploadHandler):
+    """
+    Streams each uploaded file into a SpooledTemporaryFile, which moves to
+    disk past UPLOAD_SPOOL_THRESHOLD bytes. Bodies above `max_request_bytes`
+    are rejected from their Content-Length before any file is read, files
+    above `max_file_bytes` as soon as a chunk crosses the limit.
+    """
+    def __init__(self, request=None, max_file_bytes=UPLOAD_MAX_IMAGE_BYTES, max_request_bytes=None):
+        super().__init__(request)
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.too_large = False
+        self.file = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if self.max_request_bytes and content_length > self.max_request_bytes:
+            self.too_large = True
+
+    def new_file(self, *args, **kwargs):
+        if self.too_large:
+            # The rest of the body is drained without being stored
+            raise StopUpload(connection_reset=False)
+        super().new_file(*args, **kwargs)
+        self.file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_file_bytes:
+            self.too_large = True
+            self.file.close()
+            raise StopUpload(connection_reset=False)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return UploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra
+        )
+
+    def upload_interrupted(self):
+        if self.file:
+            self.file.close()
+
+
+@contextmanager
+def measure_memory(label):
+    """
+    Growth of the peak Python heap (tracemalloc) and of the process peak RSS while
+    the block runs, printed and yielded as a dict filled in on exit. For
+    tests and benchmarks, not requests: tracing is process wide, it has to be
+    started beforehand (tracemalloc.start() or PYTHONTRACEMALLOC=1) and the
+    heap peak is only meaningful when nothing else runs meanwhile.
+    """
+    report = {}
+    is_tracing = tracemalloc.is_tracing()
+    if is_tracing:
+        tracemalloc.reset_peak()
+        start_heap = tracemalloc.get_traced_memory()[0]
+    # ru_maxrss is in kilobytes on Linux
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.monotonic()
+    try:
+        yield report
+    finally:
+        report["peak_heap_growth_bytes"] = tracemalloc.get_traced_memory()[1] - start_heap if is_tracing else None
+        report["peak_rss_growth_bytes"] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) * 1024
+        report["duration_ms"] = round((time.monotonic() - start) * 1000, 2)
+        print(f"Memory {label}: {report}")
+
+
+def limit_upload(max_file_bytes=UPLOAD_MAX_IMAGE_BYTES, max_request_bytes=None):
+    """
+    Parse the multipart body of a view with SpooledUploadHandler and answer
+    413 when it is too large. Goes below `@api_view`, works for async views.
+    """
+    def decorator(view_func):
+        def prepare(request):
+            handler = SpooledUploadHandler(request, max_file_bytes, max_request_bytes)
+            # DRF parses with the handlers of the wrapped Django request
+            getattr(request, '_request', request).upload_handlers = [handler]
+            # Parse now so the size check runs before the view does any work
+            request.FILES
+            return handler.too_large
+
+        message = f"Upload is larger than {max_file_bytes // (1024 * 1024)} MB"
+
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_async_view(request, *args, **kwargs):
+                # Parsing reads the body and may spool it to disk, keep it off the event loop
+                if await sync_to_async(prepare, thread_sensitive=False)(request):
+                    return ResponseJson(message=message, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                return await view_func(request, *args, **kwargs)
+
+            return _wrapped_async_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if prepare(request):
+                return ResponseBadRequest(message=message, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            return view_func(request, *args, **kwargs)
+
+        return _wrapped_view
+    return decorator
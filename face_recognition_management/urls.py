@@ -24,7 +24,12 @@ urlpatterns = [
     # face
     path('face/registor/host', views.registor_master_account, name="registor_master_account"),
     path('face/registor/employee', views.registration_employees, name="registor_employees"),
+    path('face/registor/employee/bulk', views.import_employees, name="import_employees"),
+    path('face/registor/employee/upload', views.request_employee_upload, name="request_employee_upload"),
+    path('face/registor/employee/finalize', views.finalize_employee_upload, name="finalize_employee_upload"),
     path('face/authenticate', views.authenticate_employees, name="authenticate_employees"),
+    path('face/authenticate/batch', views.authenticate_employees_batch, name="authenticate_employees_batch"),
+    path('face/authenticate/async', views.authenticate_employees_async, name="authenticate_employees_async"),
     path('face/test', views.upload_photo_test, name="upload_photo_test"),
     
     # account
@@ -33,6 +38,8 @@ urlpatterns = [
     path('account/detail/<str:user_id>', views.get_user_information, name="get_user_information"),
     path('account/update/<str:user_id>', views.update_account_information, name="update_account_information"),
     path('account/update/avatar/<str:user_id>', views.update_account_avatar, name="update_account_avatar"),
+    path('account/update/avatar/<str:user_id>/upload', views.request_avatar_upload, name="request_avatar_upload"),
+    path('account/update/avatar/<str:user_id>/finalize', views.finalize_avatar_upload, name="finalize_avatar_upload"),
     path('account/<str:employee_id>', views.disable_employee_in_device, name="disable_employee_in_device"),
 
     # device
@@ -51,6 +58,7 @@ urlpatterns = [
     # attendance
     path('attendance/rfid', views.verify_rfid_id, name="verify_rfid_id"),
     path('attendance/rfid/upload', views.verify_rfid_id_upload, name="verify_rfid_id_upload"),
+    path('attendance/rfid/upload/<str:job_id>', views.get_rfid_upload_job, name="get_rfid_upload_job"),
 
     # history
     # path('history/test', views.generate_data, name="generate_data"),
@@ -59,6 +67,7 @@ urlpatterns = [
     path('history/extract', views.extract_check_in_file, name="extract_check_in_file"),
     path('history/detail', views.get_detail_histories, name="get_detail_histories"),
     path('history/extract/detail', views.extract_check_in_detail, name="extract_check_in_detail"),
+    path('history/timesheet', views.get_employee_timesheet, name="get_employee_timesheet"),
     path('history/<str:device_id>', views.get_history, name="get_history"),
 
     # history action
@@ -66,6 +75,15 @@ urlpatterns = [
     path('history/action/variables', views.get_history_type, name="get_history_type"),
     path('history/user/action', views.get_history_action, name="get_history_action"),
 
+    # storage, signed URLs of the local backend
+    path('storage/upload/<str:bucket>', views.upload_local_object, name="upload_local_object"),
+    path('storage/<str:bucket>/<path:key>', views.serve_local_object, name="serve_local_object"),
+
+    # metrics
+    path('metrics/cache', views.get_cache_metrics, name="get_cache_metrics"),
+    path('metrics/write-buffer', views.get_write_buffer_metrics, name="get_write_buffer_metrics"),
+    path('metrics/bcrypt', views.get_password_hasher_metrics, name="get_password_hasher_metrics"),
+
     # Heal-check
     path('', views.hello_server, name="hello_server"),
 ]
@@ -10,6 +10,7 @@ from .views_service.device_views import *
 from .views_service.token_views import *
 from .views_service.history_views import *
 from .views_service.history_action_views import *
+from .views_service.storage_views import *
 
 @api_view(['GET'])
 def hello_server(request):
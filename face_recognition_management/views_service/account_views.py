@@ -1,15 +1,24 @@
 from django.http import JsonResponse
 from rest_framework.decorators import api_view
 import os
-import time
 import json
 from ..repository import UserRepository
+from ..repositories.user_repository import user_cache, roster_cache, DuplicateUserError
 from ..decorators import permission
 from ..constants import UserAccountStatus, Role
-from ..services import TokenService, S3Service
+from ..services import TokenService, S3Service, presign_cache
+from ..local_recognition import LocalRecognitionService
+from ..image_variants import ImageVariantService
+from ..direct_upload import DirectUploadService
+from ..image_store import ImageStore
+from ..token_revocation import claims_cache
+from ..ultils.frame_cache import FrameCache
+from ..ultils.image import InvalidImageError
 from rest_framework.decorators import api_view
 from ..responses import *
 from ..ultils.index import check_password, format_user, password_encrypt
+from ..ultils.password_hasher import PasswordHasher, PasswordHasherBusyError
+from ..ultils.uploads import limit_upload, UPLOAD_MAX_IMAGE_BYTES
 from datetime import datetime
 import uuid
 
@@ -27,29 +36,29 @@ def register_device_account(request):
             password = (request.POST.get('password') or request.data.get('password')) or "1"
             device_id = request.POST.get('deviceId') or request.data.get('deviceId')
 
-            # DynamoDB scan
-            found_account = UserRepository.find_by_username(username)
-            if found_account:
-                return ResponseBadRequest(message="Username is already exist")
-            
             # Encrypt password
             encrypted_password = password_encrypt(password)
 
-            # Use Face ID as the primary key (id) in DynamoDB
-            UserRepository.create_user({
-                "id": str(uuid.uuid4()),
-                'device_id': device_id,
-                'username': username,
-                'password': encrypted_password,
-                'creation_time': datetime.now().isoformat(),
-                'role': Role.ADMIN.value,
-                'status': UserAccountStatus.ACTIVE.value,
-            })
+            # The transactional put fails if the username is taken
+            try:
+                UserRepository.create_user({
+                    "id": str(uuid.uuid4()),
+                    'device_id': device_id,
+                    'username': username,
+                    'password': encrypted_password,
+                    'creation_time': datetime.now().isoformat(),
+                    'role': Role.ADMIN.value,
+                    'status': UserAccountStatus.ACTIVE.value,
+                })
+            except DuplicateUserError:
+                return ResponseBadRequest(message="Username is already exist")
             
             return ResponseOk(message="User registered successfully!")
 
         except json.JSONDecodeError:
             return ResponseBadRequest(message="Invalid JSON data")
+        except PasswordHasherBusyError as e:
+            return ResponseServiceUnavailable(message="Server is busy, try again later", retry_after=e.retry_after)
         except Exception as e:
             print(f"Error: {e}")
             return ResponseInternalServerError(message="Error registering new employee")
@@ -62,7 +71,7 @@ def authenticate_account(request):
         try:
             username = request.POST.get('username') or request.data.get('username')
             password = request.POST.get('password') or request.data.get('password')
-            found_account = UserRepository.find_by_username(username)
+            found_account = find_account_for_login(username)
             if not found_account:
                 return ResponseNotFound(message="User not found")
             
@@ -70,6 +79,19 @@ def authenticate_account(request):
             is_correct_pw = check_password(password, found_account["password"]);
             if not is_correct_pw:
                 return ResponseBadRequest(message="Wrong password")
+
+            # Upgrade hashes made with an older cost factor while the plain password is known,
+            # unless the password was changed since the account was read
+            if PasswordHasher.needs_rehash(found_account["password"]):
+                try:
+                    UserRepository.update_attributes(
+                        found_account["id"],
+                        {"password": password_encrypt(password)},
+                        expected={"password": found_account["password"]}
+                    )
+                except PasswordHasherBusyError:
+                    # Optional, the password was verified: retried on a later login
+                    pass
             
             
             token_service = TokenService()
@@ -92,6 +114,8 @@ def authenticate_account(request):
 
         except json.JSONDecodeError:
             return ResponseBadRequest(message="Invalid JSON data")
+        except PasswordHasherBusyError as e:
+            return ResponseServiceUnavailable(message="Too many login attempts, try again later", retry_after=e.retry_after)
         except Exception as e:
             print(f"Error: {e}")
             return ResponseInternalServerError(message="Error authenticate account")
@@ -108,6 +132,8 @@ def disable_employee_in_device(_, employee_id):
 
     found_user["status"] = UserAccountStatus.DELETED.value
     UserRepository.update_user_status(found_user);
+    LocalRecognitionService.invalidate(found_user["device_id"])
+    FrameCache.invalidate(found_user["device_id"])
     
     return ResponseOk(message="Delete user success")
 
@@ -121,6 +147,14 @@ def get_user_information(request, user_id):
 
     return ResponseOk(data=format_user(found_user))
 
+@api_view(["GET"])
+def get_cache_metrics(request):
+    return ResponseOk(data=[user_cache.metrics(), roster_cache.metrics(), claims_cache.metrics(), presign_cache.metrics()])
+
+@api_view(["GET"])
+def get_password_hasher_metrics(request):
+    return ResponseOk(data=PasswordHasher.metrics())
+
 @api_view(["GET"])
 def get_roles(request):
     roles = {role.name: role.value for role in Role}
@@ -131,6 +165,51 @@ def get_users(request):
     roles = {role.name: role.value for role in Role}
     return ResponseOk(data = roles)
 
+def find_account_for_login(username):
+    """
+    The stored record of an active account, the cache only maps the username
+    to its id: a password change or a disable made by another worker applies
+    to the next login.
+    """
+    if not username:
+        return None
+    cached_account = UserRepository.find_by_username(username)
+    found_account = cached_account and UserRepository.query_by_id(cached_account["id"])
+    if not found_account or found_account.get("username") != username:
+        # The username moved to another account since it was cached
+        found_accounts = UserRepository.find_by_attribute('username', username, limit=1)
+        found_account = found_accounts and UserRepository.query_by_id(found_accounts[0]["id"])
+    if not found_account or found_account["status"] != UserAccountStatus.ACTIVE.value:
+        return None
+    return found_account
+
+def find_user_for_update(user_id):
+    # Writes start from the stored record, not the cached copy other workers may have changed
+    found_user = UserRepository.query_by_id(user_id)
+    if not found_user or found_user["status"] != UserAccountStatus.ACTIVE.value:
+        return None
+    return found_user
+
+def set_avatar(found_user, image_key):
+    """
+    Point the user at `image_key`, on which a reference was already taken.
+
+    Returns:
+        dict | None: The updated user, None if it changed in the meantime.
+    """
+    updated_user = UserRepository.update_attributes(
+        found_user["id"],
+        {"image": image_key},
+        expected={"image": found_user.get("image")},
+        # Variants of the previous image, they are generated again for the new one
+        remove=["image_variants"]
+    )
+    if not updated_user:
+        ImageStore.release(image_key)
+        return None
+    ImageStore.replace_avatar(found_user, image_key)
+    return updated_user
+
 @api_view(["PUT"])
 def update_account_information(request, user_id):
     cur_password = request.POST.get('curPassword') or request.data.get('curPassword')
@@ -142,50 +221,107 @@ def update_account_information(request, user_id):
     gender = request.POST.get('gender') or request.data.get('gender')
 
 
-    found_user = UserRepository.find_active_user_by_id(user_id);
+    # Read past the cache, the password is checked against the stored hash
+    found_user = find_user_for_update(user_id)
     if not found_user:
         return ResponseNotFound(message="User not found")
     
+    changes = {}
+    expected = {}
     # update password
     if cur_password:
         if new_password != confirm_password:
             return ResponseBadRequest(message="New password and confirm password not match!")
         
-        # Verify password
-        is_correct_pw = check_password(cur_password, found_user["password"]);
-        if not is_correct_pw:
-            return ResponseBadRequest(message="Wrong password")
-        
-        found_user["password"] = password_encrypt(password=new_password);
+        try:
+            # Verify password
+            is_correct_pw = check_password(cur_password, found_user["password"]);
+            if not is_correct_pw:
+                return ResponseBadRequest(message="Wrong password")
+            
+            changes["password"] = password_encrypt(password=new_password);
+        except PasswordHasherBusyError as e:
+            return ResponseServiceUnavailable(message="Server is busy, try again later", retry_after=e.retry_after)
+        expected["password"] = found_user["password"]
 
-    if last_name != found_user["last_name"] and last_name: found_user["last_name"] = last_name
-    if first_name != found_user["first_name"] and last_name: found_user["first_name"] = first_name
-    if position != found_user["position"] and last_name: found_user["position"] = position
-    if gender != found_user["gender"] and last_name: found_user["gender"] = gender
+    for attribute, value in (("last_name", last_name), ("first_name", first_name), ("position", position), ("gender", gender)):
+        if value and value != found_user.get(attribute): changes[attribute] = value
 
-    #Save
-    UserRepository.save(found_user)
+    if not changes:
+        return ResponseOk(data=format_user(found_user))
 
-    return ResponseOk(data=format_user(found_user))
+    # Only the changed attributes are written, a concurrent update of the others is kept
+    updated_user = UserRepository.update_attributes(user_id, changes, expected)
+    if not updated_user:
+        return ResponseConflict()
+
+    return ResponseOk(data=format_user(updated_user))
 
 @api_view(["PUT"])
+@limit_upload(max_file_bytes=UPLOAD_MAX_IMAGE_BYTES)
 def update_account_avatar(request, user_id):
-    image_data = request.FILES['image'].read()  
-    found_user = UserRepository.find_active_user_by_id(user_id);
+    # Spooled upload, streamed to S3 without reading it into memory
+    image_file = request.FILES['image']
+    found_user = find_user_for_update(user_id)
     if not found_user:
         return ResponseNotFound(message="User not found")
     
-    image_filename = f"{found_user['device_id']}/{int(time.time() * 1000)}-{found_user['username']}.jpg"
-
-    isSuccess = S3Service.put_object(s3_bucket_employees, image_filename, image_data)
-    if not isSuccess:
+    image_filename = ImageStore.store(found_user['device_id'], image_file)
+    if not image_filename:
         return ResponseInternalServerError(message="Upload failure")
     
-    found_user["image"] = image_filename;
+    found_user = set_avatar(found_user, image_filename)
+    if not found_user:
+        return ResponseConflict()
 
-    UserRepository.save(found_user);
+    # The upload is gone once the response is sent, the variants read the object back
+    ImageVariantService.schedule(user_id, image_filename)
 
     found_user["image"] = S3Service.presigned_url(bucket_name=s3_bucket_employees, file_name=image_filename)
 
     return ResponseOk(data=format_user(found_user));
 
+@api_view(["PUT"])
+def request_avatar_upload(request, user_id):
+    """
+    Presigned POST for a new avatar, uploaded by the client straight to S3
+    and applied with `finalize_avatar_upload`.
+    """
+    found_user = UserRepository.find_active_user_by_id(user_id)
+    if not found_user:
+        return ResponseNotFound(message="User not found")
+
+    upload = DirectUploadService.issue(
+        "avatar",
+        DirectUploadService.image_key(found_user['device_id'], found_user['username']),
+        user_id=user_id
+    )
+    return ResponseOk(data=upload)
+
+@api_view(["PUT"])
+def finalize_avatar_upload(request, user_id):
+    upload_token = request.POST.get('uploadToken') or request.data.get('uploadToken')
+    upload = DirectUploadService.verify("avatar", upload_token or "")
+    if not upload or upload["user_id"] != user_id:
+        return ResponseBadRequest(message="Invalid or expired upload")
+
+    found_user = find_user_for_update(user_id)
+    if not found_user:
+        return ResponseNotFound(message="User not found")
+
+    ImageStore.acquire(upload["key"])
+    try:
+        DirectUploadService.validate_image(upload["key"])
+    except InvalidImageError as e:
+        ImageStore.release(upload["key"])
+        return ResponseBadRequest(message=str(e))
+
+    found_user = set_avatar(found_user, upload["key"])
+    if not found_user:
+        return ResponseConflict()
+    ImageVariantService.schedule(user_id, upload["key"])
+
+    found_user["image"] = S3Service.presigned_url(bucket_name=s3_bucket_employees, file_name=upload["key"])
+
+    return ResponseOk(data=format_user(found_user))
+
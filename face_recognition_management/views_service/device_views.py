@@ -3,14 +3,15 @@ from django.http import HttpResponse
 from rest_framework.decorators import api_view
 from ..repository import UserRepository, DeviceRepository
 from ..decorators import permission
-from ..constants import Role, UserAccountStatus
 from ..services import S3Service, AwsIoTService
 from rest_framework.decorators import api_view
 from ..responses import *
-from ..ultils.index import format_user, random_value
+from ..ultils.index import random_value, get_image_size
+from ..image_variants import ImageVariantService
 from ..constants import DeviceStatus
 from awscrt import mqtt
 import json
+import time
 import boto3
 import openpyxl
 
@@ -23,6 +24,13 @@ iot_client = boto3.client('iot-data', region_name=os.environ.get('AWS_REGION'))
 s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
 s3_bucket_guest = os.environ.get('AWS_S3_BUCKET_GUEST')
 
+# Presigned image URLs live for an hour, a client revalidates at least every half hour
+ROSTER_ETAG_WINDOW = 1800
+
+def is_not_modified(request, etag):
+    if_none_match = request.headers.get('If-None-Match', '')
+    return etag in [tag.strip() for tag in if_none_match.split(',')]
+
 @api_view(['POST'])
 def generate_device_id(request):
     try:
@@ -146,19 +154,33 @@ def get_employee_in_device(request, device_id):
     if not found_device_id:
         return ResponseNotFound(message=f"Device with id {device_id} not found")
 
-    device_users = UserRepository.find_users_device(device_id)
-    if not len(device_users):
+    roster = UserRepository.find_device_roster(device_id)
+    if not roster:
         return ResponseBadRequest(message="Device id not found")
 
+    # The body embeds presigned URLs, so the tag also rolls over before they expire
+    etag = f'"{roster["version"]}-{int(time.time() // ROSTER_ETAG_WINDOW)}"'
+    if is_not_modified(request, etag):
+        return ResponseNotModified(headers={'ETag': etag})
+
+    image_size = get_image_size(request)
+    for device_user in roster["employees"]:
+        device_user["image"] = ImageVariantService.pick(
+            device_user.get("image"), device_user.pop("image_variants", None), image_size
+        )
+
+    # A client may keep this body for a whole ETag window, its URLs must outlive it
+    image_urls = S3Service.presigned_urls(
+        bucket_name=s3_bucket_employees,
+        file_names=[device_user["image"] for device_user in roster["employees"]],
+        min_valid=ROSTER_ETAG_WINDOW
+    )
     updated_users = []
-    for device_user in device_users:
-        if device_user["role"] != Role.ADMIN.value and device_user["status"] != UserAccountStatus.DELETED.value:
-            s3_file_name = device_user["image"]
-            s3_url = S3Service.presigned_url(bucket_name=s3_bucket_employees, file_name=s3_file_name)
-            device_user["image"] = s3_url
-            updated_users.append(format_user(device_user))
+    for device_user in roster["employees"]:
+        device_user["image"] = image_urls.get(device_user["image"])
+        updated_users.append(device_user)
 
-    return ResponseOk(data=updated_users)
+    return ResponseOk(data=updated_users, headers={'ETag': etag})
 
 @api_view(["DELETE"])
 # @permission([Role.ADMIN.value, Role.SUPER.value])
@@ -253,14 +275,15 @@ def export_employee_in_device(request, device_id):
     if not found_device_id:
         return ResponseNotFound(message=f"Device with id {device_id} not found")
 
-    device_users = UserRepository.find_users_device(device_id)
-    if not len(device_users):
+    roster = UserRepository.find_device_roster(device_id)
+    if not roster:
         return ResponseBadRequest(message="Device id not found")
-    
-    employees = []
-    for device_user in device_users:
-        if device_user["role"] != Role.ADMIN.value and device_user["status"] != UserAccountStatus.DELETED.value:
-            employees.append(format_user(device_user))
+
+    etag = f'"{roster["version"]}"'
+    if is_not_modified(request, etag):
+        return ResponseNotModified(headers={'ETag': etag})
+
+    employees = roster["employees"]
     
     workbook = openpyxl.Workbook()
     worksheet = workbook.active
@@ -287,6 +310,7 @@ def export_employee_in_device(request, device_id):
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
     response['Content-Disposition'] = 'attachment; filename="employees.xlsx"'
+    response['ETag'] = etag
 
     # Lưu workbook vào response
     workbook.save(response)
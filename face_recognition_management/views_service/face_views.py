@@ -1,56 +1,97 @@
 from django.http import JsonResponse
 from rest_framework.decorators import api_view
+from rest_framework import status as http_status
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import time
 import json
 import os
 from botocore.exceptions import ClientError
 from ..repository import UserRepository, DeviceRepository, HistoryRepository
+from ..repositories.user_repository import DuplicateUserError
 from ..decorators import permission
 from ..constants import Role, Prefix, UserAccountStatus, AuthenticateMethod
 from ..services import S3Service, RekognitionService, AwsIoTService
+from ..local_recognition import LocalRecognitionService
+from ..image_variants import ImageVariantService
+from ..direct_upload import DirectUploadService
+from ..image_store import ImageStore
+from ..employee_import import EmployeeImportService
+from ..ultils.frame_cache import FrameCache
+from ..ultils.face_detection import FaceDetector
+from ..ultils.image import normalize_image, InvalidImageError
+from ..ultils.uploads import limit_upload, UPLOAD_MAX_IMAGE_BYTES, UPLOAD_MAX_FRAME_BYTES, UPLOAD_MAX_ARCHIVE_BYTES
 from datetime import datetime
 from rest_framework.decorators import api_view
 from ..responses import *
 from ..ultils.index import password_encrypt, generate_user_information, format_user, get_current_date
+from ..ultils.password_hasher import PasswordHasherBusyError
 
 # S3 bucket name
 s3_bucket_employees = os.environ.get('AWS_S3_BUCKET_EMPLOYEES')
 s3_bucket_guest = os.environ.get('AWS_S3_BUCKET_GUEST')
 
+# Shared by every batch request so bursts of uploads can't exhaust the worker
+BATCH_AUTHENTICATE_WORKERS = int(os.environ.get('BATCH_AUTHENTICATE_WORKERS', 4))
+BATCH_AUTHENTICATE_MAX_FRAMES = int(os.environ.get('BATCH_AUTHENTICATE_MAX_FRAMES', 50))
+# Capture times accepted for buffered frames, relative to the server clock
+BATCH_CAPTURE_MAX_AGE = int(os.environ.get('BATCH_CAPTURE_MAX_AGE', 24 * 3600))  # in seconds
+BATCH_CAPTURE_MAX_SKEW = int(os.environ.get('BATCH_CAPTURE_MAX_SKEW', 60))  # in seconds
+batch_authenticate_executor = ThreadPoolExecutor(max_workers=BATCH_AUTHENTICATE_WORKERS)
+
+# Keep references to fire-and-forget tasks so they are not garbage collected
+background_tasks = set()
+
+DUPLICATE_USER_MESSAGES = {
+    'id': "Face already exists!",
+    'username': "Username is already exist",
+    'rfid': "RFID ID is already exist",
+    'master_account': "Device already has a master account",
+}
+
+def rollback_registration(collection_id, face_id, image_filename):
+    # The account was not written, drop the face and the photo reference it would have owned
+    RekognitionService.delete_face(collection_id, face_id)
+    ImageStore.release(image_filename)
+
+def run_in_thread(func):
+    # boto3 is blocking, run it on the thread pool instead of the event loop
+    return sync_to_async(func, thread_sensitive=False)
+
+def parse_capture_time(value, now):
+    """
+    Capture time of a buffered frame, epoch seconds sent by the device.
+
+    Returns:
+        datetime | None: Local time like `datetime.now()`, None when it is not
+        a number or falls outside the accepted window around `now`.
+    """
+    try:
+        captured_at = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not now - BATCH_CAPTURE_MAX_AGE <= captured_at <= now + BATCH_CAPTURE_MAX_SKEW:
+        return None
+    return datetime.fromtimestamp(min(captured_at, now))
+
 @api_view(['POST'])
+@limit_upload(max_file_bytes=UPLOAD_MAX_IMAGE_BYTES)
 def registor_master_account(request):
     try:
         device_id = request.POST.get('deviceId') or request.data.get('deviceId')
         username = request.POST.get('username') or request.data.get('username')
         password = request.POST.get('password') or request.data.get('password')
         rfid_id = request.POST.get('rfidId') or request.data.get('rfidId')
-        image_data = request.FILES['image'].read()  
+        image_data, _ = normalize_image(request.FILES['image'])
         
         # Check device
         found_device = DeviceRepository.find_active_by_device_id(device_id)
         if not found_device:
             return ResponseBadRequest(message="Device not found")
 
-        # Check master account with device
-        found_user_device = UserRepository.find_exist_device_with_device_id(device_id)
-        if found_user_device:
-            return ResponseBadRequest(message="Device already has a master account")
-        
-        # Check if account exist with username
-        found_account = UserRepository.find_by_username(username)
-        if found_account:
-            return ResponseBadRequest(message="Username is already exist")
-        
-        found_account_with_rfid = UserRepository.find_by_rfid_id(rfid_id=rfid_id)
-        if found_account_with_rfid:
-            return ResponseBadRequest(message="RFID is already exist")
-
-        image_filename = f"{device_id}/{int(time.time() * 1000)}-{username}.jpg"
-
-        # S3 upload
-        isSuccess = S3Service.put_object(s3_bucket_employees, image_filename, image_data)
-        if not isSuccess:
-            return ResponseInternalServerError(message="Upload failure")
+        # Encrypt password, before anything is created for the account
+        encrypted_password = password_encrypt(password)
 
         # Create collection for device
         collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
@@ -58,48 +99,115 @@ def registor_master_account(request):
         if not isSuccess:
             return ResponseBadRequest(message="Collection with deviceId {device_id} already exists")
 
-        # face indexing
-        index_face_response = RekognitionService.index_face(image_filename, username, collection_id)
+        # Content-addressed key, a retried upload of the same photo is not written again
+        image_filename, needs_upload = ImageStore.reserve(device_id, image_data)
+
+        # S3 upload and face indexing
+        index_face_response = RekognitionService.register_face(
+            image_data, image_filename, username, collection_id, upload=needs_upload
+        )
         if not index_face_response["isSuccess"]:
+            ImageStore.release(image_filename)
             return ResponseInternalServerError(message=index_face_response["message"])
 
-        # Encrypt password
-        encrypted_password = password_encrypt(password)
-
-        # DynamoDB put_item
-        UserRepository.create_user({
+        # DynamoDB transactional put, fails if the device, username or RFID is taken
+        try:
+            UserRepository.create_user({
                 'id': index_face_response["face_id"],  # Rekognition Face ID as the primary key
                 'device_id': device_id,
                 'username': username,
                 'password': encrypted_password,
                 'image': image_filename,
+                'face_image': image_filename,
                 'creation_time': datetime.now().isoformat(),
                 'rfid': rfid_id,
                 'role': Role.HOST.value,
                 'status': UserAccountStatus.ACTIVE.value
             })
+        except DuplicateUserError as e:
+            rollback_registration(collection_id, index_face_response["face_id"], image_filename)
+            RekognitionService.delete_collection(collection_id)
+            return ResponseBadRequest(message=DUPLICATE_USER_MESSAGES[e.field])
+        LocalRecognitionService.invalidate(device_id)
+        ImageVariantService.schedule(index_face_response["face_id"], image_filename, image_data)
 
         return ResponseOk(message=f'Registration successful: Welcome, {username}')
+    except InvalidImageError as e:
+        return ResponseBadRequest(message=str(e))
+    except PasswordHasherBusyError as e:
+        return ResponseServiceUnavailable(message="Server is busy, try again later", retry_after=e.retry_after)
     except Exception as e:
         print(f"Error: {e}")
         return ResponseInternalServerError()
 
+def read_employee_fields(request):
+    fields = {}
+    for field, name in [
+        ('username', 'username'), ('password', 'password'), ('first_name', 'firstName'),
+        ('last_name', 'lastName'), ('position', 'position'), ('gender', 'gender'),
+        ('rfid_id', 'rfidId'), ('department', 'department'), ('employee_id', 'employeeId')
+    ]:
+        fields[field] = request.POST.get(name) or request.data.get(name)
+    # Hashed up front, a busy hasher fails the request before any face is indexed
+    fields['password'] = password_encrypt(fields['password'] or "1")
+    return fields
+
+def save_employee(device_id, collection_id, face_id, image_filename, employee, image_data=None):
+    """
+    Write the account of a newly indexed face and sync it to the device, the
+    face and its photo are removed again if the username or RFID is taken.
+    """
+    # Use Face ID as the primary key (id) in DynamoDB, the transactional
+    # put fails if the username or RFID is taken
+    try:
+        UserRepository.create_user({
+            'id': face_id,  # Rekognition Face ID as the primary key
+            'device_id': device_id,
+            'username': employee["username"],
+            'password': employee["password"],
+            'image': image_filename,
+            'face_image': image_filename,
+            'creation_time': datetime.now().isoformat(),
+            'role': Role.EMPLOYEE.value,
+            'status': UserAccountStatus.ACTIVE.value,
+            'first_name': employee["first_name"],
+            'last_name': employee["last_name"],
+            'position': employee["position"],
+            'rfid_id': employee["rfid_id"],
+            'gender': employee["gender"],
+            'deparment': employee["department"],
+            'employee_id': employee["employee_id"]
+        })
+    except DuplicateUserError as e:
+        rollback_registration(collection_id, face_id, image_filename)
+        return ResponseBadRequest(message=DUPLICATE_USER_MESSAGES[e.field])
+    LocalRecognitionService.invalidate(device_id)
+    ImageVariantService.schedule(face_id, image_filename, image_data)
+
+    # MQTT
+    message = {
+        "type": "SYNC/USER",
+        "message": "Sync data",
+        "rfid": employee["rfid_id"],
+        "id": face_id,
+        "name": f"{employee['first_name']} {employee['last_name']}",  # Ghép tên và họ với khoảng trắng
+    }
+    aws_iot_cdt = "pbl/device/employee/add"
+
+    isSuccess = AwsIoTService.publish_message(topic=aws_iot_cdt, message=message)
+
+    return ResponseOk(message="User registered successfully!")
+
 @api_view(['POST'])
+@limit_upload(max_file_bytes=UPLOAD_MAX_IMAGE_BYTES)
 def registration_employees(request):
     if request.method == 'POST':
         try:
             # Extract JSON body
             registor_id = request.POST.get('registorId') or request.data.get('registorId')
-            username = request.POST.get('username') or request.data.get('username')
-            password = (request.POST.get('password') or request.data.get('password')) or "1"
-            first_name = request.POST.get('firstName') or request.data.get('firstName')
-            last_name = request.POST.get('lastName') or request.data.get('lastName')
-            position = request.POST.get('position') or request.data.get('position')
-            gender = request.POST.get('gender') or request.data.get('gender')
-            rfid_id = request.POST.get('rfidId') or request.data.get('rfidId')
-            image_data = request.FILES['image'].read()  
-            department = request.POST.get('department') or request.data.get('department')
-            employee_id = request.POST.get('employeeId') or request.data.get('employeeId')
+            employee = read_employee_fields(request)
+            username = employee["username"]
+            image_data, _ = normalize_image(request.FILES['image'])
 
             # Query DynamoDB
             found_registor = UserRepository.find_active_user_by_id(registor_id)
@@ -108,69 +216,27 @@ def registration_employees(request):
                 return ResponseNotFound(message="Registor not found!")
             device_id = found_registor["device_id"]
 
-            # DynamoDB scan
-            found_account = UserRepository.find_by_username(username)
-            if found_account:
-                return ResponseBadRequest(message="Username is already exist")
-            
-            found_account_with_id = UserRepository.find_by_rfid_id(rfid_id=rfid_id)
-            if found_account_with_id:
-                return ResponseBadRequest(message="RFID ID is already exist")
-            
-            # Encrypt password
-            encrypted_password = password_encrypt(password)
-
-            # Generate a unique filename
-            image_filename = f"{device_id}/{int(time.time() * 1000)}-{username}.jpg"
+            # Content-addressed key, a retried upload of the same photo is not written again
+            image_filename, needs_upload = ImageStore.reserve(device_id, image_data)
             
-            # Upload the image to S3
-            isSuccess = S3Service.put_object(s3_bucket_employees, image_filename, image_data)
-            if not isSuccess:
-                return ResponseInternalServerError(message="Upload failure")
-
-            # Indexing face
+            # Upload the image to S3 and index the face
             collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
 
-            index_face_response = RekognitionService.index_face(image_filename, username.replace("@gmail.com", ""), collection_id)
+            index_face_response = RekognitionService.register_face(
+                image_data, image_filename, username.replace("@gmail.com", ""), collection_id, upload=needs_upload
+            )
             if not index_face_response["isSuccess"]:
+                ImageStore.release(image_filename)
                 return ResponseInternalServerError(message=index_face_response["message"])
 
-            # Use Face ID as the primary key (id) in DynamoDB
-            UserRepository.create_user({
-                'id': index_face_response["face_id"],  # Rekognition Face ID as the primary key
-                'device_id': device_id,
-                'username': username,
-                'password': encrypted_password,
-                'image': image_filename,
-                'creation_time': datetime.now().isoformat(),
-                'role': Role.EMPLOYEE.value,
-                'status': UserAccountStatus.ACTIVE.value,
-                'first_name': first_name,
-                'last_name': last_name,
-                'position': position,
-                'rfid_id': rfid_id,
-                'gender': gender,
-                'deparment': department,
-                'employee_id': employee_id
-            })
-            
-
-            # MQTT
-            message = {
-                "type": "SYNC/USER",
-                "message": "Sync data",
-                "rfid": rfid_id,
-                "id": index_face_response.get("face_id", ""),  # Lấy "face_id", nếu không có trả về ""
-                "name": f"{first_name} {last_name}",  # Ghép tên và họ với khoảng trắng
-            }
-            aws_iot_cdt = "pbl/device/employee/add"
-
-            isSuccess = AwsIoTService.publish_message(topic=aws_iot_cdt, message=message)
-            
-            return ResponseOk(message="User registered successfully!")
+            return save_employee(device_id, collection_id, index_face_response["face_id"], image_filename, employee, image_data)
 
         except json.JSONDecodeError:
             return ResponseBadRequest(message="Invalid JSON data")
+        except InvalidImageError as e:
+            return ResponseBadRequest(message=str(e))
+        except PasswordHasherBusyError as e:
+            return ResponseServiceUnavailable(message="Server is busy, try again later", retry_after=e.retry_after)
         except Exception as e:
             print(f"Error: {e}")
             return ResponseInternalServerError(message="Error registering new employee")
@@ -178,15 +244,117 @@ def registration_employees(request):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 @api_view(['POST'])
+def request_employee_upload(request):
+    """
+    First phase of a direct registration: a presigned POST for the photo of
+    the new employee, uploaded by the client straight to S3.
+    """
+    registor_id = request.POST.get('registorId') or request.data.get('registorId')
+    username = request.POST.get('username') or request.data.get('username')
+    if not username:
+        return ResponseBadRequest(message="Missing username")
+
+    found_registor = UserRepository.find_active_user_by_id(registor_id)
+    if not found_registor:
+        return ResponseNotFound(message="Registor not found!")
+    device_id = found_registor["device_id"]
+
+    upload = DirectUploadService.issue(
+        "employee",
+        DirectUploadService.image_key(device_id, username),
+        device_id=device_id,
+        username=username
+    )
+    return ResponseOk(data=upload)
+
+@api_view(['POST'])
+def finalize_employee_upload(request):
+    """
+    Second phase of a direct registration: index the uploaded photo from S3
+    and write the account, with the same fields as `registration_employees`.
+    """
+    try:
+        upload_token = request.POST.get('uploadToken') or request.data.get('uploadToken')
+        upload = DirectUploadService.verify("employee", upload_token or "")
+        if not upload:
+            return ResponseBadRequest(message="Invalid or expired upload")
+
+        device_id = upload["device_id"]
+        image_filename = upload["key"]
+        employee = read_employee_fields(request)
+        # The object key was signed for this username
+        employee["username"] = upload["username"]
+
+        # A repeated finalize must not remove the photo of the account it created
+        if UserRepository.find_by_username(employee["username"]):
+            return ResponseBadRequest(message="Username is already exist")
+
+        # The account holds a reference on its photo like any stored image. Taken
+        # first, so a failure hands the object to the collector instead of deleting it
+        ImageStore.acquire(image_filename)
+        try:
+            DirectUploadService.validate_image(image_filename)
+        except InvalidImageError as e:
+            ImageStore.release(image_filename)
+            return ResponseBadRequest(message=str(e))
+
+        collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
+        index_face_response = RekognitionService.index_face(
+            image_filename, employee["username"].replace("@gmail.com", ""), collection_id
+        )
+        if not index_face_response["isSuccess"]:
+            ImageStore.release(image_filename)
+            return ResponseInternalServerError(message=index_face_response["message"])
+
+        return save_employee(device_id, collection_id, index_face_response["face_id"], image_filename, employee)
+
+    except PasswordHasherBusyError as e:
+        return ResponseServiceUnavailable(message="Server is busy, try again later", retry_after=e.retry_after)
+    except Exception as e:
+        print(f"Error: {e}")
+        return ResponseInternalServerError(message="Error registering new employee")
+
+@api_view(['POST'])
+@limit_upload(max_file_bytes=UPLOAD_MAX_ARCHIVE_BYTES)
+def import_employees(request):
+    try:
+        registor_id = request.POST.get('registorId') or request.data.get('registorId')
+        manifest_file = request.FILES.get('manifest')
+        photos_file = request.FILES.get('photos')
+        if not registor_id or not manifest_file or not photos_file:
+            return ResponseBadRequest(message="Missing registorId, manifest or photos")
+
+        import_response = EmployeeImportService.import_employees(registor_id, manifest_file, photos_file)
+        if not import_response["isSuccess"]:
+            return ResponseBadRequest(message=import_response["message"])
+
+        return ResponseOk(data=import_response["report"], message=import_response["message"])
+
+    except PasswordHasherBusyError as e:
+        return ResponseServiceUnavailable(message="Server is busy, try again later", retry_after=e.retry_after)
+    except Exception as e:
+        print(f"Error: {e}")
+        return ResponseInternalServerError(message="Error importing employees")
+
+@api_view(['POST'])
+@limit_upload(max_file_bytes=UPLOAD_MAX_FRAME_BYTES)
 def authenticate_employees(request):
     try:
-        image_data = request.FILES['file'].read()
+        image_data, _ = normalize_image(request.FILES['file'])
         device_id = request.POST.get('deviceId') or request.data.get('deviceId') or "BC5BPV21X0"
         # Extract image data and generate a unique filename
         collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
+
+        # Near-identical frame from the same burst, reuse the earlier result
+        face = FaceDetector.try_align(image_data)
+        frame_hash = FrameCache.hash_face(face)
+        cached_result = FrameCache.get(device_id, frame_hash)
+        if cached_result:
+            return ResponseOk(data=dict(cached_result["data"]), message=cached_result["message"])
+
         # Search for the face in the Rekognition collection
         try:
-            face_id = RekognitionService.authenticate(collection_id, image_data)
+            face_id = LocalRecognitionService.authenticate(device_id, collection_id, image_data, face)
             if not face_id:
                 return ResponseUnAuthorized(message="Authentication failed: No matching face found.")
         except Exception as e:
@@ -219,11 +387,15 @@ def authenticate_employees(request):
             status=status
         )
         
-        return ResponseOk(
-            data=format_user(found_user), 
-            message=f'Authentication successful: Welcome, {found_user["username"]}',
-        )
+        message = f'Authentication successful: Welcome, {found_user["username"]}'
+        user_data = format_user(found_user)
+        FrameCache.set(device_id, frame_hash, {"isSuccess": True, "message": message, "data": dict(user_data)})
+
+        return ResponseOk(data=user_data, message=message)
     
+    except InvalidImageError as e:
+        return ResponseBadRequest(message=str(e))
+
     except ClientError as e:
         return ResponseInternalServerError(message=f'Error retrieving user: {e.response["Error"]["Message"]}')
     
@@ -232,15 +404,198 @@ def authenticate_employees(request):
         return ResponseInternalServerError()
 
 @api_view(['POST'])
+@limit_upload(
+    max_file_bytes=UPLOAD_MAX_FRAME_BYTES,
+    max_request_bytes=UPLOAD_MAX_FRAME_BYTES * BATCH_AUTHENTICATE_MAX_FRAMES
+)
+def authenticate_employees_batch(request):
+    """
+    Authenticate frames buffered by a kiosk in one request.
+
+    Frames are matched on a bounded worker pool, each identified person is
+    looked up once and gets one history row, at the capture time of their
+    first frame, all rows are written in a single batch. The response holds
+    one result per uploaded frame.
+
+    `capturedAt` (optional, once per frame and in the same order) is the
+    epoch time the frame was taken. Without it the rows are dated now.
+    """
+    try:
+        frames = request.FILES.getlist('files')
+        device_id = request.POST.get('deviceId') or request.data.get('deviceId')
+        if not device_id or not frames:
+            return ResponseBadRequest(message="Missing deviceId or files")
+
+        if len(frames) > BATCH_AUTHENTICATE_MAX_FRAMES:
+            return ResponseBadRequest(message=f"Too many frames, maximum is {BATCH_AUTHENTICATE_MAX_FRAMES}")
+
+        captured_values = request.POST.getlist('capturedAt')
+        if captured_values and len(captured_values) != len(frames):
+            return ResponseBadRequest(message="capturedAt must be given once per frame")
+        now = time.time()
+        captured_times = (
+            [parse_capture_time(value, now) for value in captured_values] if captured_values
+            else [datetime.fromtimestamp(now)] * len(frames)
+        )
+
+        collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
+
+        def match_frame(frame):
+            try:
+                image_data, _ = normalize_image(frame)
+                face = FaceDetector.try_align(image_data)
+                return LocalRecognitionService.authenticate(device_id, collection_id, image_data, face), None
+            except InvalidImageError as e:
+                return None, str(e)
+            except Exception as e:
+                print(f"Error: {e}")
+                return None, "Authentication failed: No matching face found."
+
+        face_matches = list(batch_authenticate_executor.map(match_frame, frames))
+
+        # One lookup per identified person, however many frames show them
+        face_ids = list({face_id for face_id, _ in face_matches if face_id})
+        found_users = dict(zip(face_ids, batch_authenticate_executor.map(UserRepository.find_active_user_by_id, face_ids)))
+
+        results = []
+        histories = {}
+        for index, (face_id, error_message) in enumerate(face_matches):
+            result = {"index": index, "isSuccess": False, "message": error_message, "data": None}
+            results.append(result)
+
+            if not face_id:
+                result["message"] = error_message or "Authentication failed: No matching face found."
+                continue
+
+            found_user = found_users.get(face_id)
+            if not found_user:
+                result["message"] = "User not found!"
+                continue
+
+            if (found_user["device_id"] != device_id or found_user["status"] != UserAccountStatus.ACTIVE.value):
+                result["message"] = "User not exist in devices"
+                continue
+
+            captured_at = captured_times[index]
+            if not captured_at:
+                result["message"] = "Invalid capture time"
+                continue
+
+            if face_id not in histories or captured_at < histories[face_id][0]:
+                histories[face_id] = (captured_at, HistoryRepository.build_history(
+                    user_id=face_id,
+                    user_information=generate_user_information(found_user),
+                    authenticate_with=AuthenticateMethod.FACE_RECOGNITION.value,
+                    status="Check In",
+                    timestamp=captured_at
+                ))
+
+            result["isSuccess"] = True
+            result["message"] = f'Authentication successful: Welcome, {found_user["username"]}'
+            result["data"] = format_user(dict(found_user))
+
+        # Save history
+        if histories:
+            HistoryRepository.create_histories([history for _, history in histories.values()])
+
+        return ResponseOk(data=results, message="Success")
+
+    except ClientError as e:
+        return ResponseInternalServerError(message=f'Error retrieving user: {e.response["Error"]["Message"]}')
+
+    except Exception as e:
+        print(e)
+        return ResponseInternalServerError()
+
+@limit_upload(max_file_bytes=UPLOAD_MAX_FRAME_BYTES)
+async def authenticate_employees_async(request):
+    """
+    Async version of `authenticate_employees` for the ASGI server.
+
+    The blocking calls run on the thread pool and the history row is
+    written after the response has been sent.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        image_data, _ = await run_in_thread(normalize_image)(request.FILES['file'])
+        device_id = request.POST.get('deviceId') or "BC5BPV21X0"
+        collection_id = f'{device_id}-{Prefix.REKOGNITION_COLLECTION_PREFIX.value}'
+
+        # Near-identical frame from the same burst, reuse the earlier result
+        face = await run_in_thread(FaceDetector.try_align)(image_data)
+        frame_hash = FrameCache.hash_face(face)
+        cached_result = FrameCache.get(device_id, frame_hash)
+        if cached_result:
+            return ResponseJson(data=dict(cached_result["data"]), message=cached_result["message"])
+
+        try:
+            face_id = await run_in_thread(LocalRecognitionService.authenticate)(device_id, collection_id, image_data, face)
+        except Exception as e:
+            print(f"Error: {e}")
+            face_id = None
+        if not face_id:
+            return ResponseJson(
+                message="Authentication failed: No matching face found.",
+                status_code=http_status.HTTP_401_UNAUTHORIZED
+            )
+
+        found_user = await run_in_thread(UserRepository.find_active_user_by_id)(face_id)
+        if not found_user:
+            return ResponseJson(message="User not found!", status_code=http_status.HTTP_404_NOT_FOUND)
+
+        if (found_user["device_id"] != device_id or found_user["status"] != UserAccountStatus.ACTIVE.value):
+            return ResponseJson(message="User not exist in devices", status_code=http_status.HTTP_401_UNAUTHORIZED)
+
+        status = "Check In"
+        user_information = generate_user_information(found_user)
+
+        message = f'Authentication successful: Welcome, {found_user["username"]}'
+        user_data = format_user(found_user)
+        FrameCache.set(device_id, frame_hash, {"isSuccess": True, "message": message, "data": dict(user_data)})
+
+        response = ResponseJson(data=user_data, message=message)
+
+        # Save history once the response is on the wire
+        loop = asyncio.get_running_loop()
+
+        def save_history():
+            task = loop.create_task(run_in_thread(HistoryRepository.create_history)(
+                user_id=found_user["id"],
+                user_information=user_information,
+                authenticate_with=AuthenticateMethod.FACE_RECOGNITION.value,
+                status=status
+            ))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+        response.on_close.append(lambda: loop.call_soon_threadsafe(save_history))
+        return response
+
+    except InvalidImageError as e:
+        return ResponseJson(message=str(e), status_code=http_status.HTTP_400_BAD_REQUEST)
+
+    except ClientError as e:
+        return ResponseJson(
+            message=f'Error retrieving user: {e.response["Error"]["Message"]}',
+            status_code=http_status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    except Exception as e:
+        print(e)
+        return ResponseJson(message='Internal Server Error', status_code=http_status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@limit_upload(max_file_bytes=UPLOAD_MAX_IMAGE_BYTES)
 def upload_photo_test(request):
     if request.method == 'POST':
         print(request.FILES)
         if 'file' in request.FILES:
-            image_data = request.FILES['file'].read()
             # Save file to the default storage
             image_filename = f"{int(time.time() * 1000)}-test.jpg"
-            # S3 upload
-            isSuccess = S3Service.put_object(s3_bucket_employees, image_filename, image_data)
+            # S3 upload, streamed from the spooled upload
+            isSuccess = S3Service.put_object(s3_bucket_employees, image_filename, request.FILES['file'])
             if not isSuccess:
                 return ResponseInternalServerError(message="Upload failure")
             # Optionally, save file information to the database
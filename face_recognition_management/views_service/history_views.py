@@ -1,26 +1,31 @@
 import json
-from django.http import HttpResponse, JsonResponse
+import os
+import tempfile
+from django.http import FileResponse, JsonResponse
 import openpyxl
 from rest_framework.decorators import api_view
-from rest_framework.decorators import api_view
+from rest_framework import status
 from ..responses import *
 from ..repository import DeviceRepository, HistoryRepository, UserRepository
-from ..ultils.index import is_valid_date, format_date, get_start_key, get_histories_response, generate_user_information, get_current_date
+from ..repositories.history_repository import history_writer
+from ..repositories.history_action_repository import history_action_writer
+from ..ultils.index import is_valid_date, format_date, get_histories_response, generate_user_information, get_current_date, get_image_size
+from ..ultils.cursor import decode_cursor, encode_cursor, get_page_limit, InvalidCursorError
 from ..constants import AuthenticateMethod
+from ..rfid_upload import RfidUploadService
 from datetime import datetime
 
+# Longest range of one timesheet request, every day of it is read from the history
+TIMESHEET_MAX_DAYS = int(os.environ.get('TIMESHEET_MAX_DAYS', 92))
+
 @api_view(["GET"])
 # @permission([Role.HOST.value, Role.ADMIN.value, Role.SUPER.value])
 def get_history(request, device_id):
-    limit = int(request.GET.get('limit', 20))
-    page = int(request.GET.get('page', 1))
-    start_key_str= request.GET.get('startKey', None) 
-    start_key_str = format_date(start_key_str)
-    
-    if start_key_str and not is_valid_date(start_key_str):
-        return ResponseBadRequest("Invalid Date")
-    
-    start_key = get_start_key(start_key_str, device_id)
+    limit = get_page_limit(request)
+    try:
+        start_key = decode_cursor(request.GET.get('cursor'), f"history:{device_id}")
+    except InvalidCursorError as e:
+        return ResponseBadRequest(message=str(e))
     
     found_device = DeviceRepository.find_active_by_device_id(device_id)
     if not found_device:
@@ -28,32 +33,31 @@ def get_history(request, device_id):
     
     histories = HistoryRepository.get_history_of_device(
         device_id=device_id, 
-        page=page, 
         limit=limit, 
         start_key=start_key
     );
 
-    response_data = get_histories_response(histories)
+    response_data = get_histories_response(histories, get_image_size(request))
+    response_data["next"] = encode_cursor(histories[1], f"history:{device_id}")
 
     return ResponseOk(data=response_data)
 
 @api_view(["GET"])
 # @permission([Role.HOST.value, Role.ADMIN.value, Role.SUPER.value])
 def get_history_by_date(request, device_id):
-    limit = int(request.GET.get('limit', 20))
-    page = int(request.GET.get('page', 1))
-    start_key_str= request.GET.get('startKey', None) 
+    limit = get_page_limit(request)
     date_str = request.GET.get('date', None)
     if not date_str:
         return ResponseBadRequest("Missing Date")
 
     date = format_date(date_str)
-    start_key_str = get_start_key(start_key_str, device_id)
-    
-    if (start_key_str and not is_valid_date(start_key_str)) or not is_valid_date(date):
+    if not is_valid_date(date):
         return ResponseOk("Invalid Date")
-    
-    start_key = get_start_key(start_key_str)
+
+    try:
+        start_key = decode_cursor(request.GET.get('cursor'), f"history:{device_id}:{date}")
+    except InvalidCursorError as e:
+        return ResponseBadRequest(message=str(e))
 
     found_device = DeviceRepository.find_active_by_device_id(device_id)
     if not found_device:
@@ -61,13 +65,13 @@ def get_history_by_date(request, device_id):
     
     histories = HistoryRepository.get_history_by_date(
         device_id=device_id, 
-        page=page, 
         limit=limit, 
         start_key=start_key,
         date=date
     );
 
-    response_data = get_histories_response(histories)
+    response_data = get_histories_response(histories, get_image_size(request))
+    response_data["next"] = encode_cursor(histories[1], f"history:{device_id}:{date}")
 
     return ResponseOk(data=response_data)
 
@@ -82,15 +86,9 @@ def get_histories_by_date(request):
     timestamp = datetime.strptime(date_str, '%Y-%m-%d')
     date_query = timestamp.strftime('%Y-%m-%d')
     
-    histories = HistoryRepository.get_histories_by_date(date=date_query)
+    unique_histories = HistoryRepository.get_daily_attendance(date=date_query)
 
-    seen_ids = set()
-    unique_histories = list(
-        map(lambda x: x if x['id'] not in seen_ids and not seen_ids.add(x['id']) else None, histories)
-    )
-    unique_histories = [history for history in unique_histories if history is not None]
-
-    return ResponseOk(data=unique_histories, message="Success")
+    return ResponseStreamingOk(data=unique_histories, message="Success")
 
 
 @api_view(["GET"])
@@ -108,6 +106,26 @@ def get_detail_histories(request):
 
     return ResponseOk(data=histories, message="Success")
 
+@api_view(["GET"])
+def get_employee_timesheet(request):
+    user_id = request.GET.get('userId', None)
+    start_date = format_date(request.GET.get('from', None))
+    # An unparseable `to` is rejected, not replaced by `from`
+    end_date = format_date(request.GET['to']) if request.GET.get('to') else start_date
+
+    if not user_id or not is_valid_date(start_date):
+        return ResponseBadRequest("Missing Request Data")
+    if not is_valid_date(end_date):
+        return ResponseBadRequest("Invalid end date")
+
+    days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    if not 0 < days <= TIMESHEET_MAX_DAYS:
+        return ResponseBadRequest(f"The range must cover 1 to {TIMESHEET_MAX_DAYS} days")
+
+    timesheet = HistoryRepository.get_timesheet(user_id=user_id, start_date=start_date, end_date=end_date)
+
+    return ResponseOk(data=timesheet, message="Success")
+
 @api_view(["POST"])
 def verify_rfid_id(request):
     rfid_id = request.POST.get('rfid_id') or request.data.get('rfid_id')
@@ -143,59 +161,47 @@ def verify_rfid_id(request):
 def verify_rfid_id_upload(request):
     try:
         data = json.loads(request.body)  # Parse JSON từ request
-        for history in data:
-            if history["rfid"] is not None: 
-                rfid_id = history["rfid"];
-                found_account = UserRepository.find_by_rfid_id(rfid_id=rfid_id)
-                if not found_account:
-                    continue;
-
-                status = "Check in";
-
-                HistoryRepository.create_history(
-                    user_id=found_account["id"], 
-                    user_information=generate_user_information(found_account), 
-                    authenticate_with= AuthenticateMethod.RFID.value,
-                    status = status
-                )
-
-        return ResponseOk(data=None, message="Success!")
+        if not isinstance(data, list):
+            return JsonResponse({"error": "Dữ liệu không hợp lệ"}, status=400)
+
+        job = RfidUploadService.upload(data)
+        if job["status"] in ("pending", "running"):
+            # Large upload, the device polls the job instead of holding the request open
+            return ResponseOk(data=job, message="Processing", status_code=status.HTTP_202_ACCEPTED)
+        if job["status"] == "failed":
+            return ResponseInternalServerError(message=job["message"])
+
+        return ResponseOk(data=job, message="Success!")
     except json.JSONDecodeError:
         return JsonResponse({"error": "Dữ liệu không hợp lệ"}, status=400)
 
 @api_view(["GET"])
-def generate_data(request):
-    HistoryRepository.generate_test_data("BC5BPV21X0", page=4)
-    return Response()
+def get_rfid_upload_job(request, job_id):
+    job = RfidUploadService.get_job(job_id)
+    if not job:
+        return ResponseNotFound(message="Job not found")
+    return ResponseOk(data=job)
 
 @api_view(["GET"])
-def extract_check_in_file(request):
-    date_str = request.GET.get('date', None)
+def get_write_buffer_metrics(request):
+    return ResponseOk(data=[history_writer.metrics(), history_action_writer.metrics()])
 
-    if not date_str:
-        return ResponseBadRequest("Missing Date")
-
-    timestamp = datetime.strptime(date_str, '%Y-%m-%d')
-    date_query = timestamp.strftime('%Y-%m-%d')
-    
-    histories = HistoryRepository.get_histories_by_date(date=date_query)
-
-    seen_ids = set()
-    unique_histories = list(
-        map(lambda x: x if x['id'] not in seen_ids and not seen_ids.add(x['id']) else None, histories)
-    )
-    unique_histories = [history for history in unique_histories if history is not None]
+@api_view(["GET"])
+def generate_data(request):
+    HistoryRepository.generate_test_data("BC5BPV21X0", page=4)
+    return Response()
 
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Employees"
+def export_histories(histories):
+    # Write-only workbook: rows go to a temporary file as the histories are read
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Employees")
 
     # Thêm tiêu đề (header) vào file Excel
     headers = ['Employee ID', 'Name', 'Department', 'Date', 'Check In']
     worksheet.append(headers)
 
     # Ghi dữ liệu vào các dòng của worksheet
-    for history in unique_histories:
+    for history in histories:
         worksheet.append([
             history.get("employee_information", {}).get("employee_id", "None"),  # Lấy employee_id hoặc 'None'
             history.get("employee_information", {}).get("name", "None"),         # Lấy name hoặc 'None'
@@ -203,16 +209,31 @@ def extract_check_in_file(request):
             history.get('created_date', "None"),                                 # Lấy created_date hoặc 'None'
             history.get('check_in', "None"),                                     # Lấy check_in hoặc 'None'
         ])
-    # Tạo HTTP response để trả về file Excel
-    response = HttpResponse(
+
+    # The file is streamed to the client in chunks and removed once closed
+    export_file = tempfile.TemporaryFile()
+    workbook.save(export_file)
+    export_file.seek(0)
+    return FileResponse(
+        export_file,
+        as_attachment=True,
+        filename="employees.xlsx",
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
-    response['Content-Disposition'] = 'attachment; filename="employees.xlsx"'
 
-    # Lưu workbook vào response
-    workbook.save(response)
+@api_view(["GET"])
+def extract_check_in_file(request):
+    date_str = request.GET.get('date', None)
 
-    return response 
+    if not date_str:
+        return ResponseBadRequest("Missing Date")
+
+    timestamp = datetime.strptime(date_str, '%Y-%m-%d')
+    date_query = timestamp.strftime('%Y-%m-%d')
+    
+    unique_histories = HistoryRepository.get_daily_attendance(date=date_query)
+
+    return export_histories(unique_histories)
 
 @api_view(["GET"])
 def extract_check_in_detail(request):
@@ -227,30 +248,4 @@ def extract_check_in_detail(request):
     
     histories = HistoryRepository.get_histories_detail(user_id=user_id, date_query=date_query)
 
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Employees"
-
-    # Thêm tiêu đề (header) vào file Excel
-    headers = ['Employee ID', 'Name', 'Department', 'Date', 'Check In']
-    worksheet.append(headers)
-
-    # Ghi dữ liệu vào các dòng của worksheet
-    for history in histories:
-        worksheet.append([
-            history.get("employee_information", {}).get("employee_id", "None"),  # Lấy employee_id hoặc 'None'
-            history.get("employee_information", {}).get("name", "None"),         # Lấy name hoặc 'None'
-            history.get("employee_information", {}).get("department", "None"),    # Lấy department hoặc 'None'
-            history.get('created_date', "None"),                                 # Lấy created_date hoặc 'None'
-            history.get('check_in', "None"),                                     # Lấy check_in hoặc 'None'
-        ])
-    # Tạo HTTP response để trả về file Excel
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="employees.xlsx"'
-
-    # Lưu workbook vào response
-    workbook.save(response)
-
-    return response 
\ No newline at end of file
+    return export_histories(histories) 
\ No newline at end of file
@@ -0,0 +1,54 @@
+import time
+from django.http import FileResponse
+from rest_framework.decorators import api_view
+from ..storage import storage, LocalStorageBackend
+from ..responses import *
+from ..ultils.uploads import limit_upload, UPLOAD_MAX_IMAGE_BYTES
+
+# Signed URLs of the local storage backend, they stand in for the S3 presigned ones
+
+@api_view(["GET"])
+def serve_local_object(request, bucket, key):
+    if not isinstance(storage, LocalStorageBackend):
+        return ResponseNotFound()
+
+    expires = request.GET.get('expires', '')
+    if not expires.isdigit() or int(expires) < time.time():
+        return ResponseForbidden(message="Expired URL")
+    if not LocalStorageBackend.verify(request.GET.get('signature'), 'get', bucket, key, expires):
+        return ResponseForbidden(message="Invalid signature")
+
+    try:
+        file = open(storage.path(bucket, key), 'rb')
+    except (OSError, ValueError):
+        return ResponseNotFound(message="Object not found")
+
+    response = FileResponse(file, content_type='image/jpeg')
+    response['Content-Disposition'] = 'inline'
+    # Cacheable for as long as the URL is valid, like the S3 presigned ones
+    response['Cache-Control'] = f"private, max-age={int(expires) - int(time.time())}"
+    return response
+
+@api_view(["POST"])
+@limit_upload(UPLOAD_MAX_IMAGE_BYTES)
+def upload_local_object(request, bucket):
+    if not isinstance(storage, LocalStorageBackend):
+        return ResponseNotFound()
+
+    key = request.POST.get('key', '')
+    expires = request.POST.get('expires', '')
+    max_bytes = request.POST.get('max_bytes', '')
+    if not expires.isdigit() or int(expires) < time.time():
+        return ResponseForbidden(message="Expired upload")
+    if not LocalStorageBackend.verify(request.POST.get('signature'), 'post', bucket, key, expires, max_bytes):
+        return ResponseForbidden(message="Invalid signature")
+
+    file = request.FILES.get('file')
+    if not file or not 0 < file.size <= int(max_bytes):
+        return ResponseBadRequest(message="Invalid file size")
+    if not (file.content_type or '').startswith('image/'):
+        return ResponseBadRequest(message="Only images can be uploaded")
+
+    if not storage.put_object(bucket, key, file):
+        return ResponseInternalServerError(message="Upload failure")
+    return ResponseCreated(data={"key": key})
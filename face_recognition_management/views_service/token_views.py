@@ -1,6 +1,8 @@
 from rest_framework.decorators import api_view
 from ..repository import UserRepository
 from ..services import TokenService
+from ..token_revocation import RevocationList, token_digest
+from ..constants import BlackListReson
 from rest_framework.decorators import api_view
 from ..responses import *
 
@@ -19,6 +21,10 @@ def generate_new_at(request):
     if not verify_token_response["isSuccess"]:
         return ResponseUnAuthorized(message=verify_token_response["payload"])
     
+    # A refresh token can only be used once
+    if RevocationList.is_revoked(token_digest(refresh_token)):
+        return ResponseUnAuthorized(message="Token revoked")
+
     # Get payload
     payload = verify_token_response['payload']
 
@@ -29,5 +35,6 @@ def generate_new_at(request):
     token_pairs = token_service.generate(found_user);
 
     # add older token into blackblist
+    RevocationList.revoke(refresh_token, found_user["id"], BlackListReson.REFRESH.value, payload["exp"])
 
     return ResponseOk(data=token_pairs)
\ No newline at end of file